@@ -1,4 +1,4 @@
-from snpp.utils.signed_graph import g2m
+from snpp.utils.signed_graph import g2m, g2csr
 from snpp.utils.data import load_train_test_graphs
 from snpp.utils.edge_filter import filter_by_min_triangle_count
 
@@ -6,9 +6,7 @@ from snpp.cores.joint_part_pred import iterative_approach
 from snpp.cores.max_balance import faster_greedy
 from snpp.cores.lowrank import partition_graph
 from snpp.cores.budget_allocation import constant_budget
-from snpp.cores.triangle import build_edge2edges
-
-from snpp.utils.spark import sc
+from snpp.cores.triangle import build_edge2edges_csr, TriangleCountCache
 
 
 dataset = 'slashdot'
@@ -31,15 +29,15 @@ part, iter_preds, status = iterative_approach(
         T=confident_edges,
         k=k,
         graph_partition_f=partition_graph,
-        graph_partition_kwargs=dict(sc=sc,
-                                    lambda_=lambda_,
+        graph_partition_kwargs=dict(lambda_=lambda_,
                                     iterations=max_iter,
                                     seed=random_seed),
         budget_allocation_f=constant_budget,
         budget_allocation_kwargs=dict(const=200),
         solve_maxbalance_f=faster_greedy,
-        solve_maxbalance_kwargs={'edge2edges': build_edge2edges(train_g_ud.copy(),
-                                                                confident_edges)},
+        solve_maxbalance_kwargs={'edge2edges': build_edge2edges_csr(g2csr(train_g_ud),
+                                                                    confident_edges),
+                                 'triangle_cache': TriangleCountCache(confident_edges)},
         truth=set([(i, j, test_g[i][j]['sign'])
                    for i, j in confident_edges]),
         perform_last_partition=False
@@ -36,10 +36,10 @@ def do_one_run(group_size,
 
     # low-rank (matrix completion) method
     X, Y, errors = alq(Q, k, lambda_, max_iter,
-                       init_method='svd',
+                       init_method='randomized',
                        verbose=False)
 
-    pred_Q = np.sign(np.dot(X, Y))n
+    pred_Q = np.sign(np.dot(X, Y))
     # print('true_Q: \n{}'.format(true_Q))
     # print('pred_Q: \n{}'.format(pred_Q))
 
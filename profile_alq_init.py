@@ -0,0 +1,45 @@
+"""
+Time to reach a target error for the initializations of `alq`
+
+The target is 1.5 times the error of a long run from the full SVD initialization.
+"""
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from snpp.cores.lowrank import alq, init_factors
+from snpp.utils.data import example_for_intuition
+
+
+np.random.seed(12345)
+
+group_size = 200
+group_number = 8
+known_edge_percentage = 0.2
+k = group_number
+lambda_ = 0.2
+max_iter = 60
+
+Q, _ = example_for_intuition(group_size, group_number, known_edge_percentage)
+_, _, errors = alq(Q, k, lambda_, max_iter, init_method='svd', verbose=False)
+target = errors[-1] * 1.5
+print('n={}, target error={:.2f}'.format(Q.shape[0], target))
+
+for init_method in ['random', 'svd', 'randomized', 'lanczos']:
+    for name, M in [('dense', Q), ('sparse', csr_matrix(Q))]:
+        if init_method == 'svd' and name == 'sparse':
+            continue  # same as lanczos
+        start = time.time()
+        X, Y = init_factors(M, k, init_method)
+        init_time = time.time() - start
+
+        warm_start = {'X': X, 'Y': Y}
+        error = np.inf
+        n_iter = 0
+        while error > target and n_iter < max_iter:
+            _, _, (error, ) = alq(M, k, lambda_, 1, verbose=False,
+                                  warm_start=warm_start)
+            n_iter += 1
+        total_time = time.time() - start
+        print('{:>10} ({:>6}): init {:.3f}s, {} iterations, {:.3f}s to target{}'.format(
+            init_method, name, init_time, n_iter, total_time,
+            '' if error <= target else ' (not reached)'))
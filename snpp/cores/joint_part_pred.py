@@ -17,11 +17,12 @@ def iterative_approach(g, T, k,
                        budget_allocation_kwargs={},
                        solve_maxbalance_kwargs={},
                        truth=None,
-                       perform_last_partition=True):
+                       perform_last_partition=True,
+                       warm_start=False):
     """
     Params:
     
-    g: networkx.Graph (**mutable**)
+    g: networkx.Graph or SignedGraph (**mutable**)
     T: target edge set (set of edges, (i, j))
        the i, j order doesn't matter because it's undirected
     k: partition number
@@ -29,9 +30,15 @@ def iterative_approach(g, T, k,
     graph_partition_f: method for graph partitioning
     budget_allocation_f: budget allocation method
     solve_maxbalance_f: method for approximating the max balance problem
+    solve_maxbalance_kwargs: passed to every solve_maxbalance_f call,
+        for faster_greedy, `edge2edges` and `triangle_cache` (TriangleCountCache over T)
+        are built once and reused across iterations
 
     truth: set of (i, j, s), the ground truth for targets
         for debugging purpose
+    warm_start: if True, graph_partition_f is called with `warm_start`,
+        a dict of the partitioner state (previous partition, factors, centroids...)
+        that it reads and updates, so that each partitioning starts from the previous one
 
     Returns:
     
@@ -53,6 +60,9 @@ def iterative_approach(g, T, k,
     iter_n = 0
     all_predictions = []
 
+    if warm_start:
+        graph_partition_kwargs = dict(graph_partition_kwargs, warm_start={})
+
     while len(remaining_targets) > 0:
         iter_n += 1
         print('iteration={}, #remaining targets={}'.format(
@@ -2,9 +2,20 @@
 # Kunegis, Spectral Analysis of Signed Graphs for Clustering, Prediction and Visualization, 2010
 
 
-from .spectral import build_laplacian_related_matrices
+from .spectral import build_laplacian_related_matrices, \
+    build_laplacian_related_matrices_sparse
 
 
 def build_L(W):
     W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices(W)
     return D_p + D_n - W_p + W_n
+
+
+def build_L_sparse(W):
+    """W: the sign matrix (sparse)
+
+    return:
+    the signed laplacian matrix in csr
+    """
+    W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices_sparse(W)
+    return (D_p + D_n - W_p + W_n).tocsr()
@@ -6,16 +6,25 @@ Adaptation of Louvain community detection to signed network.
 Main change: definition of modularity
 """
 
+import numpy as np
 import networkx as nx
 from collections import defaultdict
+from scipy import sparse
+from scipy.sparse import csr_matrix, diags, hstack
+from functools import partial
 from tqdm import tqdm
 from snpp.utils.signed_graph import matrix2graph, \
     to_multigraph
+from snpp.utils.matrix import expand_rows
+from snpp.utils.parallel import n_workers, shard_bounds, worker_arrays, \
+    SharedArrayPool
 
 
 __all__ = ["partition_at_level", "modularity",
            "best_partition", "generate_dendrogram",
-           "generate_dendogram", "induced_graph"]
+           "generate_dendogram", "induced_graph",
+           "generate_dendrogram_csr", "split_csr_by_sign", "ArrayStatus",
+           "induced_csr", "modularity_csr"]
 
 __author__ = """Thomas Aynaud (thomas.aynaud@lip6.fr)"""
 #    Copyright (C) 2009 by
@@ -25,6 +34,9 @@ __author__ = """Thomas Aynaud (thomas.aynaud@lip6.fr)"""
 
 __PASS_MAX = -1
 __MIN = 0.0000001
+# nodes per process under which a color of `__one_level_colored` is evaluated
+# in the calling process (a round trip to the pool costs about as much as 200 nodes)
+__MIN_SHARD = 1000
 
 import networkx as nx
 import sys
@@ -77,6 +89,7 @@ def partition_at_level(dendrogram, level):
 def modularity(partition, graph):
     """    
     Compute the modularity of a partition of a graph
+    (on its positive/negative adjacency matrices, see `modularity_csr`)
     
     Parameters
     ----------
@@ -112,46 +125,56 @@ def modularity(partition, graph):
     if type(graph) != nx.MultiGraph:
         raise TypeError("Bad graph type, use only non directed graph")
 
-    graph_p, graph_n = split_graph_by_sign(graph)
+    nodes, A_p, A_n = split_csr_by_sign(graph)
+    if A_p.nnz == 0 or A_n.nnz == 0:
+        raise ValueError("A graph without link has an undefined modularity")
+    return modularity_csr([partition[node] for node in nodes], A_p, A_n)[0]
 
-    inc_p = defaultdict(float)
-    deg_p = defaultdict(float)
-    inc_n = defaultdict(float)
-    deg_n = defaultdict(float)
 
-    links_p = graph_p.size(weight='weight')
-    links_n = graph_n.size(weight='weight')    
+def modularity_csr(labels, A_p, A_n):
+    """
+    Signed modularity of a partition, Q = Q_p - Q_n, where for each sign
 
-    if links_p == 0  or links_n == 0:
-        raise ValueError("A graph without link has an undefined modularity")
+    Q_s = \sum_c in_s(c) / 2m_s - (deg_s(c) / 2m_s)^2
 
-    for node in tqdm(graph):
-        com = partition[node]
-        deg_p[com] += graph_p.degree(node, weight = 'weight')
-        deg_n[com] += graph_n.degree(node, weight = 'weight')
-        for neighbor, keyed_datas in graph[node].items():
-            print('edge', node, neighbor)
-            if partition[neighbor] == com:  # same partition
-                for key, datas in keyed_datas.items():
-                    weight = datas.get("weight", 1)
-                    if neighbor == node:
-                        if datas['sign'] == 1:
-                            inc_p[com] += weight
-                        else:
-                            inc_n[com] += weight
-                    else:
-                        if datas['sign'] == 1:
-                            inc_p[com] += weight / 2
-                        else:
-                            inc_n[com] += weight / 2
-    res = 0.
-    for com in set(partition.values()):
-        res += ((inc_p[com] / (2*links_p)) - (deg_p[com] / (2.*links_p))**2)
-        res -= ((inc_n[com] / (2*links_n)) - (deg_n[com] / (2.*links_n))**2)
-    return res
+    with in_s(c) the weight of the edges inside community c,
+    deg_s(c) the sum of the degrees of its nodes and m_s the total weight
+    (same as `modularity`, in O(nnz) vectorized operations)
+
+    Parameters
+    ----------
+    labels: array (n, )
+       the community of each node, any labels (e.g. from another partitioner)
+    A_p, A_n: csr matrices
+       the positive/negative adjacency matrices, self loops being doubled
+       on the diagonal (see `split_csr_by_sign`)
+
+    Returns
+    -------
+    Q, Q_p, Q_n: float
+       the modularity and its positive/negative components
+       (a sign without any edge has a component of 0)
+    """
+    _, labels = np.unique(np.asarray(labels), return_inverse=True)
+    n_coms = labels.max() + 1 if len(labels) > 0 else 0
+    components = []
+    for A in (A_p, A_n):
+        A = csr_matrix(A)
+        two_m = A.data.sum()
+        if two_m == 0:
+            components.append(0.)
+            continue
+        row_labels = np.repeat(labels, np.diff(A.indptr))
+        same = (row_labels == labels[A.indices])
+        internals = np.bincount(row_labels[same], A.data[same], minlength=n_coms) / 2
+        degrees = np.bincount(row_labels, A.data, minlength=n_coms)
+        components.append(float(np.sum(internals / two_m - (degrees / two_m)**2)))
+    Q_p, Q_n = components
+    return Q_p - Q_n, Q_p, Q_n
     
 
-def best_partition(graph, k):
+def best_partition(graph, k, warm_start=None, method='csr', moved_tol=0.,
+                   n_jobs=None, seed=None):
     """Compute the partition of the graph nodes which maximises the modularity
     (or try..) using the Louvain heuristices
 
@@ -163,6 +186,18 @@ def best_partition(graph, k):
     graph: networkx.Graph
        the networkx graph which is decomposed
     k:  the number of communities
+    warm_start: dict, optional
+       state shared across calls (e.g. by `iterative_approach`),
+       the previous partition 'C' (if any) is refined instead of starting from singletons,
+       and the new partition is stored back
+    method: str, optional
+       'csr': local moving over arrays (`generate_dendrogram_csr`),
+       'networkx': over the dicts of `Status` (`generate_dendrogram`)
+    moved_tol: float, optional
+       the passes of a level stop when they move at most this fraction of the nodes
+       (default: until no node moves)
+    n_jobs, seed: optional
+       parallel local moving for method='csr' (see `generate_dendrogram_csr`)
 
     Returns
     -------
@@ -213,11 +248,23 @@ def best_partition(graph, k):
     """
     # convert to multigraph
     mg = to_multigraph(graph)
-    dendo = generate_dendrogram(mg, k)
-    return partition_at_level(dendo, len(dendo) - 1)
+    part_init = None
+    if warm_start is not None and warm_start.get('C') is not None:
+        C = warm_start['C']
+        part_init = {node: int(C[node]) for node in mg.nodes()}
+    assert method in {'csr', 'networkx'}
+    if method == 'csr':
+        dendo = generate_dendrogram_csr(mg, k, part_init=part_init, moved_tol=moved_tol,
+                                        n_jobs=n_jobs, seed=seed)
+    else:
+        dendo = generate_dendrogram(mg, k, part_init=part_init, moved_tol=moved_tol)
+    partition = partition_at_level(dendo, len(dendo) - 1)
+    if warm_start is not None:
+        warm_start['C'] = partition
+    return partition
 
 
-def generate_dendrogram(graph, k):
+def generate_dendrogram(graph, k, part_init=None, moved_tol=0.):
     """Find communities in the graph and return the associated dendrogram
 
     A dendrogram is a tree and each level is a partition of the graph nodes.  Level 0 is the first partition, which contains the smallest communities, and the best is len(dendrogram) - 1. The higher the level is, the bigger are the communities
@@ -227,8 +274,13 @@ def generate_dendrogram(graph, k):
     ----------
     graph: networkx.MultiGraph
         the networkx graph which will be decomposed
+    k:  the number of communities
     part_init: dict, optionnal
         the algorithm will start using this partition of the nodes. It's a dictionary where keys are their nodes and values the communities
+        (warm start: the first level refines it, and if it ends up with at most k communities, it is the only level)
+    moved_tol: float, optional
+        the passes of a level stop when they move at most this fraction of the nodes
+        (default: until no node moves)
 
     Returns
     -------
@@ -272,25 +324,27 @@ def generate_dendrogram(graph, k):
 
     current_graph = graph.copy()
     status = Status()
-    status.init(current_graph)
-    mod = __modularity(status)
+    status.init(current_graph, part_init)
+    mod = status.mod
     status_list = list()
-    __one_level(current_graph, status)
-    new_mod = __modularity(status)
+    __one_level(current_graph, status, moved_tol)
+    new_mod = status.mod
     partition = __renumber(status.node2com)
     status_list.append(partition)
     mod = new_mod
-    current_graph = induced_graph(partition, current_graph)
-    status.init(current_graph)
 
-    if len(set(partition.values())) < k:
+    part_size = len(set(partition.values()))
+    if part_size < k or (part_init is not None and part_size == k):
         # no need to partition anymore
         return status_list
+
+    current_graph = induced_graph(partition, current_graph)
+    status.init(current_graph)
     
     while True:
         print("__one_level")
-        __one_level(current_graph, status)
-        new_mod = __modularity(status)
+        __one_level(current_graph, status, moved_tol)
+        new_mod = status.mod
         if new_mod - mod < __MIN:
             break
         partition = __renumber(status.node2com)
@@ -350,22 +404,48 @@ def induced_graph(partition, graph):
     >>> nx.is_isomorphic(int, goal)
     True
     """
-    ret = nx.MultiGraph()
-    ret.add_nodes_from(partition.values())
-
-    for node1, node2, datas in tqdm(graph.edges_iter(data=True)):
-        weight = datas.get("weight", 1)
-        sign = datas['sign']
-        com1 = partition[node1]
-        com2 = partition[node2]
-        if not ret.has_edge(com1, com2, key=sign):
-            ret.add_edge(com1, com2, key=sign, weight=weight, sign=sign)
-        else:
-            ret[com1][com2][sign]['weight'] += weight
+    nodes, A_p, A_n = split_csr_by_sign(graph)
+    coms, labels = np.unique([partition[node] for node in nodes], return_inverse=True)
+    coms = coms.tolist()
 
+    ret = nx.MultiGraph()
+    ret.add_nodes_from(coms)
+    for sign, A in zip((1, -1), induced_csr(labels, A_p, A_n)):
+        A = sparse.triu(A).tocoo()
+        # self loops are doubled on the diagonal
+        weights = np.where(A.row == A.col, A.data / 2, A.data)
+        ret.add_edges_from((coms[i], coms[j], sign, {'weight': w, 'sign': sign})
+                           for i, j, w in zip(A.row.tolist(), A.col.tolist(),
+                                              weights.tolist()))
     return ret
 
 
+def induced_csr(labels, A_p, A_n):
+    """
+    Positive/negative adjacency matrices of the graph where nodes are the communities
+    (as `induced_graph`, see `split_csr_by_sign` for the matrices)
+
+    With P the n x c community indicator matrix, they are P^T A_p P and P^T A_n P:
+    the diagonal is twice the internal weight of the communities,
+    i.e. the self loops of the new nodes, and the row sums are their degrees
+
+    Parameters
+    ----------
+    labels: int array (n, )
+       the community of each node, in 0..c-1
+    A_p, A_n: csr matrices (n x n)
+
+    Returns
+    -------
+    A_p, A_n: csr matrices (c x c)
+    """
+    labels = np.asarray(labels)
+    n = labels.shape[0]
+    c = labels.max() + 1 if n > 0 else 0
+    P = csr_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, c))
+    return tuple((P.T.dot(A).dot(P)).tocsr() for A in (A_p, A_n))
+
+
 def __renumber(dictionary):
     """Renumber the values of the dictionary from 0 to n
     """
@@ -413,21 +493,23 @@ def __load_binary(data):
     return graph
 
 
-def __one_level(graph, status):
+def __one_level(graph, status, moved_tol=0.):
     """
-    TODO
     Compute one level of communities
+
+    The passes over the nodes stop when one increases the modularity
+    (status.mod, kept up to date by __remove and __insert) by less than __MIN,
+    or moves at most moved_tol * (number of nodes) nodes
     """
-    modif = True
+    n_moved = 1
+    max_moved = moved_tol * graph.number_of_nodes()
     nb_pass_done = 0
-    cur_mod = __modularity(status)
-    new_mod = cur_mod
+    new_mod = status.mod
 
-    while modif and nb_pass_done != __PASS_MAX:
+    while n_moved > 0 and nb_pass_done != __PASS_MAX:
         cur_mod = new_mod
-        modif = False
+        n_moved = 0
         nb_pass_done += 1
-        print('#pass_done={}'.format(nb_pass_done))
         for node in tqdm(graph.nodes()):
             com_node = status.node2com[node]
             # k_i / 2m
@@ -457,9 +539,10 @@ def __one_level(graph, status):
                      neigh_communities[best_com][0], neigh_communities[best_com][1],
                      status)
             if best_com != com_node:
-                modif = True
-        new_mod = __modularity(status)
-        if new_mod - cur_mod < __MIN:
+                n_moved += 1
+        print('#pass_done={}, #moved={}'.format(nb_pass_done, n_moved))
+        new_mod = status.mod
+        if new_mod - cur_mod < __MIN or n_moved <= max_moved:
             break
 
         
@@ -511,6 +594,8 @@ class Status(object):
         self.loops_p = dict([])
         self.loops_n = dict([])
 
+        self.mod = 0.  # modularity, kept up to date by __remove and __insert
+
     def __str__(self):
         return ("node2com: " + str(self.node2com) + " degrees: "
             + str(self.degrees) + " internals: " + str(self.internals)
@@ -531,8 +616,32 @@ class Status(object):
         new_status.gdegrees_n = self.gdegrees_n.copy()
         new_status.total_weight_n = self.total_weight_n
 
+        new_status.loops_p = self.loops_p.copy()
+        new_status.loops_n = self.loops_n.copy()
+        new_status.mod = self.mod
+        return new_status
+
+    def com_modularity(self, com):
+        """the term of community com in the modularity (see `__modularity`)
+        """
+        links_p = float(self.total_weight_p)
+        links_n = float(self.total_weight_n)
+        result = 0.
+        if links_p > 0:
+            result += (self.internals_p.get(com, 0.) / (2.*links_p)
+                       - (self.degrees_p.get(com, 0.) / (2.*links_p))**2)
+        if links_n > 0:
+            result -= (self.internals_n.get(com, 0.) / (2.*links_n)
+                       - (self.degrees_n.get(com, 0.) / (2.*links_n))**2)
+        return result
+
     def init(self, graph, part=None):
-        """Initialize the status of a graph with every node in one community"""
+        """Initialize the status of a graph with every node in one community
+        (or in its community in `part`, dict of node -> community)
+
+        The status of the previous graph, if any, is discarded.
+        """
+        self.__init__()
         graph_p, graph_n = split_graph_by_sign(graph)
 
         # DEBUG
@@ -609,9 +718,11 @@ class Status(object):
                                     inc_p += weight / 2
                                 else:
                                     inc_n += weight / 2
-                print(self.internals_p)
                 self.internals_p[com] += inc_p
                 self.internals_n[com] += inc_n
+
+        self.mod = sum(self.com_modularity(com)
+                       for com in set(self.node2com.values()))
                
 
 def __neighcom(node, graph, status):
@@ -639,7 +750,9 @@ def __neighcom(node, graph, status):
 def __remove(node, com, weight_p, weight_n, status):
     """
     ADAPT
-    Remove node from community com and modify status"""
+    Remove node from community com and modify status
+    (the modularity is updated from the change of the term of com)"""
+    status.mod -= status.com_modularity(com)
     status.degrees_p[com] = (status.degrees_p.get(com, 0.)
                             - status.gdegrees_p.get(node, 0.))
     status.degrees_n[com] = (status.degrees_n.get(com, 0.)
@@ -650,10 +763,13 @@ def __remove(node, com, weight_p, weight_n, status):
     status.internals_n[com] = float(status.internals_n.get(com, 0.) -
                                     weight_n - status.loops_n.get(node, 0.))
     status.node2com[node] = -1
+    status.mod += status.com_modularity(com)
 
 
 def __insert(node, com, weight_p, weight_n, status):
-    """ Insert node into community and modify status"""
+    """ Insert node into community and modify status
+    (the modularity is updated from the change of the term of com)"""
+    status.mod -= status.com_modularity(com)
     status.node2com[node] = com
     status.degrees_p[com] = (status.degrees_p.get(com, 0.) +
                              status.gdegrees_p.get(node, 0.))
@@ -663,6 +779,7 @@ def __insert(node, com, weight_p, weight_n, status):
                                     weight_p + status.loops_p.get(node, 0.))
     status.internals_n[com] = float(status.internals_n.get(com, 0.) +
                                     weight_n + status.loops_n.get(node, 0.))
+    status.mod += status.com_modularity(com)
 
 
 def __modularity(status):
@@ -694,6 +811,495 @@ def __modularity(status):
     return result
 
 
+def split_csr_by_sign(graph):
+    """
+    Positive and negative weighted adjacency matrices of a signed graph
+
+    Parameters
+    ----------
+    graph: networkx.MultiGraph
+       edges keyed by sign, as built by `to_multigraph`
+
+    Returns
+    -------
+    nodes: list
+       row/column i of the matrices is node nodes[i]
+    A_p, A_n: scipy.sparse.csr_matrix of float64
+       symmetric, a self loop of weight w being 2 w on the diagonal,
+       so that the row sums are the degrees (as networkx counts loops)
+    """
+    nodes = graph.nodes()
+    index = {node: i for i, node in enumerate(nodes)}
+    n = len(nodes)
+    rows, cols, weights, signs = [], [], [], []
+    for node1, node2, datas in graph.edges_iter(data=True):
+        rows.append(index[node1])
+        cols.append(index[node2])
+        weights.append(datas.get("weight", 1))
+        signs.append(datas['sign'])
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+    weights = np.array(weights, dtype=np.float64)
+    signs = np.array(signs)
+    if (weights <= 0).any():
+        raise ValueError("Bad graph type, use positive weights")
+
+    matrices = []
+    for sign in (1, -1):
+        mask = (signs == sign)
+        r, c, w = rows[mask], cols[mask], weights[mask]
+        loops = (r == c)
+        A = csr_matrix((np.concatenate([w * (1 + loops), w[~loops]]),
+                        (np.concatenate([r, c[~loops]]),
+                         np.concatenate([c, r[~loops]]))),
+                       shape=(n, n))
+        A.sum_duplicates()
+        matrices.append(A)
+    return nodes, matrices[0], matrices[1]
+
+
+class ArrayStatus(object):
+    """
+    Same as `Status`, over the nodes 0..n-1 of positive/negative adjacency matrices
+    (see `split_csr_by_sign`), with the state in arrays instead of dicts:
+
+    - node2com: int32 (n, ), -1 for a node removed from its community
+    - gdegrees, loops: float64 (n, 2), per node
+    - degrees, internals: float64 (n, 2), per community
+      (communities are numbered in 0..n-1)
+
+    column 0 being for the positive edges and 1 for the negative ones,
+    also available as the views gdegrees_p, gdegrees_n, etc.
+    """
+
+    def __init__(self, A_p, A_n, part=None):
+        """
+        part: array of the initial community of each node (default to singletons)
+        """
+        self.A_p = A_p.tocsr()
+        self.A_n = A_n.tocsr()
+        n = A_p.shape[0]
+
+        self.total_weight_p = self.A_p.sum() / 2.  # $m$
+        self.total_weight_n = self.A_n.sum() / 2.
+        assert self.total_weight_p > 0
+        assert self.total_weight_n > 0
+
+        self.gdegrees = np.column_stack([  # k_i
+            np.asarray(A.sum(axis=1), dtype=np.float64).ravel()
+            for A in (self.A_p, self.A_n)])
+        self.loops = np.column_stack([A.diagonal().astype(np.float64) / 2
+                                      for A in (self.A_p, self.A_n)])
+
+        if part is None:
+            self.node2com = np.arange(n, dtype=np.int32)
+        else:
+            _, codes = np.unique(np.asarray(part), return_inverse=True)
+            self.node2com = codes.astype(np.int32)
+
+        # $\sum_{tot}$ and $\sum_{in}$
+        self.degrees = np.column_stack([
+            np.bincount(self.node2com, self.gdegrees[:, i], minlength=n)
+            for i in (0, 1)])
+        self.internals = np.column_stack([self.__internals(A)
+                                          for A in (self.A_p, self.A_n)])
+
+        for name in ('gdegrees', 'loops', 'degrees', 'internals'):
+            setattr(self, name + '_p', getattr(self, name)[:, 0])
+            setattr(self, name + '_n', getattr(self, name)[:, 1])
+
+        # the neighbors (without self loops) of both signs in one csr structure,
+        # the weights between a node and community c being accumulated
+        # in the row c of the scratch buffer (reset after each use)
+        off_p = self.A_p - diags(self.A_p.diagonal())
+        off_n = self.A_n - diags(self.A_n.diagonal())
+        off_p.eliminate_zeros()
+        off_n.eliminate_zeros()
+        neighbors = hstack([off_p, off_n], format='csr')
+        self.neighbor_ptr = neighbors.indptr
+        self.neighbors = (neighbors.indices % n).astype(np.int32)
+        self.neighbor_signs = (neighbors.indices >= n).astype(np.int32)
+        self.neighbor_weights = neighbors.data.astype(np.float64)
+        self.scratch = np.zeros((n, 2), dtype=np.float64)
+
+        self.two_m = 2. * np.array([self.total_weight_p, self.total_weight_n])
+        self.mod = self.modularity()  # kept up to date by remove and insert
+
+    def __internals(self, A):
+        A = A.tocoo()
+        same = (self.node2com[A.row] == self.node2com[A.col])
+        # bincount of an empty selection is int64 whatever the weights
+        return np.bincount(self.node2com[A.row[same]], A.data[same] / 2,
+                           minlength=A.shape[0]).astype(np.float64)
+
+    def modularity(self):
+        """same as `__modularity`, over all the communities
+        """
+        per_sign = np.sum(self.internals / self.two_m - (self.degrees / self.two_m)**2,
+                          axis=0)
+        return float(per_sign[0] - per_sign[1])
+
+    def com_modularity(self, com):
+        """the term of community com (or the terms of an array of communities)
+        in the modularity
+        """
+        per_sign = self.internals[com] / self.two_m - (self.degrees[com] / self.two_m)**2
+        return per_sign[..., 0] - per_sign[..., 1]
+
+    def neighcom(self, node):
+        """
+        Same as `__neighcom`: the positive/negative weights between node
+        and its neighboring communities are accumulated in the rows of scratch
+        (to be reset by the caller)
+
+        Returns:
+        int32 array of the neighboring communities, with repetitions
+        """
+        start, end = self.neighbor_ptr[node], self.neighbor_ptr[node + 1]
+        coms = self.node2com[self.neighbors[start:end]]
+        np.add.at(self.scratch, (coms, self.neighbor_signs[start:end]),
+                  self.neighbor_weights[start:end])
+        return coms
+
+    def remove(self, node, com, weights):
+        """same as `__remove`, weights: (weight_p, weight_n)
+        """
+        self.mod -= self.com_modularity(com)
+        self.degrees[com] -= self.gdegrees[node]
+        self.internals[com] -= weights + self.loops[node]
+        self.node2com[node] = -1
+        self.mod += self.com_modularity(com)
+
+    def insert(self, node, com, weights):
+        """same as `__insert`, weights: (weight_p, weight_n)
+        """
+        self.mod -= self.com_modularity(com)
+        self.node2com[node] = com
+        self.degrees[com] += self.gdegrees[node]
+        self.internals[com] += weights + self.loops[node]
+        self.mod += self.com_modularity(com)
+
+    def move(self, nodes, coms, weights_old, weights_new):
+        """
+        remove and insert several nodes which are not adjacent (at once)
+
+        nodes: int array, coms: their new communities
+        weights_old, weights_new: (len(nodes), 2), their (positive, negative) weights
+            to their current and new communities
+        """
+        old = self.node2com[nodes]
+        affected = np.unique(np.concatenate([old, coms]))
+        self.mod -= np.sum(self.com_modularity(affected))
+        np.subtract.at(self.degrees, old, self.gdegrees[nodes])
+        np.add.at(self.degrees, coms, self.gdegrees[nodes])
+        np.subtract.at(self.internals, old, weights_old + self.loops[nodes])
+        np.add.at(self.internals, coms, weights_new + self.loops[nodes])
+        self.node2com[nodes] = coms
+        self.mod += np.sum(self.com_modularity(affected))
+
+
+def __one_level_csr(status, moved_tol=0.):
+    """
+    Same as `__one_level` over an `ArrayStatus`, the nodes being visited in 0..n-1
+
+    The gains are those of `__one_level`, the one of staying being computed
+    as if the node was removed from its community,
+    which is only updated (`remove`/`insert`) when the node moves.
+    """
+    n = status.node2com.shape[0]
+    n_moved = 1
+    max_moved = moved_tol * n
+    nb_pass_done = 0
+    new_mod = status.mod
+    node2com, scratch, degrees = status.node2com, status.scratch, status.degrees
+    ptr = status.neighbor_ptr.tolist()
+    # k_i / 2m, and the sign of the positive/negative parts of the gains
+    degc_totw = status.gdegrees / (2. * np.array([status.total_weight_p,
+                                                  status.total_weight_n]))
+    signs = np.array([1., -1.])
+    # gain of the community of the node for the node itself (as removed from it)
+    own = np.dot(status.gdegrees * degc_totw, signs)
+
+    while n_moved > 0 and nb_pass_done != __PASS_MAX:
+        cur_mod = new_mod
+        n_moved = 0
+        nb_pass_done += 1
+        for node in range(n):
+            if ptr[node] == ptr[node + 1]:
+                # no neighbor, nothing to gain
+                continue
+            com_node = node2com[node]
+            coms = status.neighcom(node)
+
+            # (dnc_p - tot_p k_p / 2m_p) - (dnc_n - tot_n k_n / 2m_n)
+            incr = np.dot(scratch[coms] - degrees[coms] * degc_totw[node], signs)
+            incr[coms == com_node] += own[node]
+            best = incr.argmax()
+            best_com = coms[best]
+
+            # as __one_level: moving must strictly increase, more than staying
+            if best_com != com_node and incr[best] > 0:
+                own_incr = np.dot(scratch[com_node] - degrees[com_node] * degc_totw[node],
+                                  signs) + own[node]
+                if incr[best] >= own_incr:
+                    status.remove(node, com_node, scratch[com_node])
+                    status.insert(node, best_com, scratch[best_com])
+                    n_moved += 1
+            scratch[coms] = 0
+        new_mod = status.mod
+        if new_mod - cur_mod < __MIN or n_moved <= max_moved:
+            break
+
+
+def color_nodes(ptr, neighbors, seed=None):
+    """
+    Coloring of the nodes such that adjacent nodes have different colors,
+    by successive independent sets of the nodes of locally maximal (random) priority
+
+    Parameters
+    ----------
+    ptr, neighbors: the indptr and indices of the csr adjacency matrix (without self loops)
+    seed: seed of the priorities
+
+    Returns
+    -------
+    colors: list of int arrays
+       the nodes of each color (in ascending order), without the nodes that have no neighbor
+    """
+    n = len(ptr) - 1
+    priority = np.random.RandomState(seed).permutation(n)
+    owner, _ = expand_rows(ptr, np.arange(n))
+    rows, cols = owner, np.asarray(neighbors)
+    uncolored = (np.diff(ptr) > 0)
+    colors = []
+    while uncolored.any():
+        live = uncolored[rows] & uncolored[cols]
+        rows, cols = rows[live], cols[live]
+        beaten = np.zeros(n, dtype=bool)
+        beaten[rows[priority[cols] > priority[rows]]] = True
+        chosen = np.flatnonzero(uncolored & ~beaten)
+        colors.append(chosen)
+        uncolored[chosen] = False
+    return colors
+
+
+def __best_moves(nodes, arrays):
+    """
+    The moves of `__one_level_csr` for nodes which are not adjacent,
+    all evaluated on the same state
+
+    arrays: dict of the state of an `ArrayStatus`
+        ('node2com', 'degrees', 'neighbor_ptr', 'neighbors', 'neighbor_signs',
+        'neighbor_weights', 'degc_totw' (k_i / 2m) and 'own' (see `__one_level_csr`))
+
+    Returns:
+    the nodes which move, their new community,
+    and their (positive, negative) weights to the old and new communities
+    """
+    node2com, degrees = arrays['node2com'], arrays['degrees']
+    n = node2com.shape[0]
+    signs = np.array([1., -1.])
+
+    owner, pos = expand_rows(arrays['neighbor_ptr'], nodes)
+    coms = node2com[arrays['neighbors'][pos]]
+    # weights between each node and its neighboring communities
+    keys, key_index = np.unique(owner.astype(np.int64) * n + coms, return_inverse=True)
+    dnc = np.zeros((len(keys), 2))
+    np.add.at(dnc, (key_index, arrays['neighbor_signs'][pos]),
+              arrays['neighbor_weights'][pos])
+    owner, coms = keys // n, keys % n
+    node, com_node = nodes[owner], node2com[nodes[owner]]
+
+    # same gains as __one_level
+    incr = np.dot(dnc - degrees[coms] * arrays['degc_totw'][node], signs)
+    own = (coms == com_node)
+    incr[own] += arrays['own'][node[own]]
+
+    # best community of each node (ties: the smallest community)
+    order = np.lexsort((-incr, owner))
+    first = order[np.r_[True, owner[order][1:] != owner[order][:-1]]]
+    best_com, best_incr = coms[first], incr[first]
+    moving_node = nodes[owner[first]]
+    com_moving = node2com[moving_node]
+
+    # gain of staying, as removed from its community
+    own_incr = (np.dot(-degrees[com_moving] * arrays['degc_totw'][moving_node], signs)
+                + arrays['own'][moving_node])
+    w_old = np.zeros((len(first), 2))
+    own_rows = np.flatnonzero(own)
+    w_old[np.searchsorted(owner[first], owner[own_rows])] = dnc[own_rows]
+    own_incr += np.dot(w_old, signs)
+
+    moves = (best_com != com_moving) & (best_incr > 0) & (best_incr >= own_incr)
+    return (moving_node[moves], best_com[moves].astype(np.int32),
+            w_old[moves], dnc[first[moves]])
+
+
+def _best_moves_shard(nodes):
+    return __best_moves(nodes, worker_arrays())
+
+
+def __one_level_colored(status, moved_tol=0., n_jobs=1, seed=None):
+    """
+    Parallel version of `__one_level_csr`
+
+    The nodes are visited color by color (see `color_nodes`).
+    The moves of the nodes of a color are evaluated together on the same state
+    (same gains as `__one_level`), in shards over n_jobs processes
+    (of at least `__MIN_SHARD` nodes, smaller colors staying in this process),
+    then applied.
+    As these nodes are not adjacent, their weights to the communities
+    do not depend on each other's moves, so the bookkeeping stays exact,
+    only the community degrees of the gains can be outdated.
+
+    The result only depends on the seed of the coloring,
+    not on the number of processes.
+    """
+    n = status.node2com.shape[0]
+    n_moved = 1
+    max_moved = moved_tol * n
+    nb_pass_done = 0
+    new_mod = status.mod
+    colors = color_nodes(status.neighbor_ptr, status.neighbors, seed)
+
+    degc_totw = status.gdegrees / status.two_m
+    arrays = {'node2com': status.node2com, 'degrees': status.degrees,
+              'neighbor_ptr': status.neighbor_ptr, 'neighbors': status.neighbors,
+              'neighbor_signs': status.neighbor_signs,
+              'neighbor_weights': status.neighbor_weights,
+              'degc_totw': degc_totw,
+              'own': np.dot(status.gdegrees * degc_totw, [1., -1.])}
+    n_procs = n_workers(n_jobs)
+    pool = None
+    # the nodes and communities changed since the pool's copy was last updated
+    stale_nodes, stale_coms = [], []
+
+    try:
+        while n_moved > 0 and nb_pass_done != __PASS_MAX:
+            cur_mod = new_mod
+            n_moved = 0
+            nb_pass_done += 1
+            for nodes in colors:
+                n_shards = min(n_procs, len(nodes) // __MIN_SHARD)
+                if n_shards <= 1:
+                    moves = [__best_moves(nodes, arrays)]
+                else:
+                    if pool is None:
+                        pool = SharedArrayPool(arrays, n_procs)
+                    elif stale_nodes:
+                        changed = np.concatenate(stale_nodes)
+                        pool.arrays['node2com'][changed] = status.node2com[changed]
+                        changed = np.concatenate(stale_coms)
+                        pool.arrays['degrees'][changed] = status.degrees[changed]
+                    stale_nodes, stale_coms = [], []
+                    shards = [nodes[start:end] for start, end in
+                              shard_bounds(len(nodes), n_shards)]
+                    moves = pool.map(_best_moves_shard, shards)
+                moving, new_com, w_old, w_new = (np.concatenate(m) for m in zip(*moves))
+                if len(moving) == 0:
+                    continue
+                if pool is not None:
+                    stale_nodes.append(moving)
+                    stale_coms += [status.node2com[moving], new_com]
+                status.move(moving, new_com, w_old, w_new)
+                n_moved += len(moving)
+            new_mod = status.mod
+            if new_mod - cur_mod < __MIN or n_moved <= max_moved:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def __renumber_array(labels):
+    """Renumber the labels from 0, in the order of their first occurrence
+    (as `__renumber` does for the node order)
+    """
+    _, first, codes = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[np.argsort(first)] = np.arange(len(first), dtype=np.int32)
+    return rank[codes]
+
+
+def generate_dendrogram_csr(graph, k, part_init=None, moved_tol=0., n_jobs=None, seed=None):
+    """Same as `generate_dendrogram`, with the local moving over arrays
+    (see `ArrayStatus`) and the levels aggregated by `induced_csr`
+
+    Parameters
+    ----------
+    graph: networkx.MultiGraph
+        the networkx graph which will be decomposed
+    k:  the number of communities
+    part_init: dict, optionnal
+        the partition to start from (see `generate_dendrogram`)
+    moved_tol: float, optional
+        see `generate_dendrogram`
+    n_jobs: int, optional
+        None: the nodes are visited one by one (`__one_level_csr`),
+        else by batches of non-adjacent nodes, over n_jobs processes
+        (`__one_level_colored`, see `n_workers`)
+    seed: int, optional
+        seed of the coloring of the nodes (for n_jobs)
+
+    Returns
+    -------
+    dendrogram: list of dictionaries
+        as `generate_dendrogram`
+    """
+    if type(graph) != nx.MultiGraph:
+        raise TypeError("Bad graph type, use only non directed graph")
+
+    if graph.number_of_edges() == 0:
+        part = dict([])
+        for node in graph.nodes():
+            part[node] = node
+        return part
+
+    nodes, A_p, A_n = split_csr_by_sign(graph)
+    part = None
+    if part_init is not None:
+        part = [part_init[node] for node in nodes]
+    status = ArrayStatus(A_p, A_n, part)
+    one_level = (__one_level_csr if n_jobs is None else
+                 partial(__one_level_colored, n_jobs=n_jobs, seed=seed))
+    one_level(status, moved_tol)
+    mod = status.mod
+    labels = __renumber_array(status.node2com)
+    partition = dict(zip(nodes, labels.tolist()))
+    status_list = [partition]
+
+    part_size = labels.max() + 1
+    if part_size < k or (part_init is not None and part_size == k):
+        # no need to partition anymore
+        return status_list
+
+    status = ArrayStatus(*induced_csr(labels, status.A_p, status.A_n))
+
+    while True:
+        one_level(status, moved_tol)
+        new_mod = status.mod
+        if new_mod - mod < __MIN:
+            break
+        labels = __renumber_array(status.node2com)
+        partition = dict(enumerate(labels.tolist()))
+
+        part_size = labels.max() + 1
+        if part_size == k:
+            break
+        elif part_size > k:
+            # compare which partition number is closer to k
+            prev_count = len(set(status_list[-1].values()))
+            if abs(prev_count - k) > abs(part_size - k):
+                status_list.append(partition)
+            break
+
+        status_list.append(partition)
+        mod = new_mod
+
+        status = ArrayStatus(*induced_csr(labels, status.A_p, status.A_n))
+    return status_list[:]
+
+
 def main():
     """Main function to mimic C++ version behavior"""
     try:
@@ -1,14 +1,18 @@
+import os
+import time
 import scipy
 import networkx as nx
 import numpy as np
 from scipy import sparse
 from scipy.sparse import linalg
 from scipy.sparse import csr_matrix
-from pyspark.mllib.recommendation import ALS
+from multiprocessing.pool import ThreadPool
+from sklearn.utils.extmath import randomized_svd
 
-from .spectral import predict_cluster_labels, predict_cluster_labels_svd
+from .spectral import predict_cluster_labels_svd, predict_cluster_labels_factors
 from ..utils.matrix import indexed_entries
-from ..utils.signed_graph import fill_diagonal
+from ..utils.signed_graph import fill_diagonal, g2csr
+from ..utils.parallel import n_workers
 
 
 csr_dot = csr_matrix.dot
@@ -18,65 +22,319 @@ def get_error(Q, X, Y, W):
     return np.sum((W * (Q - np.dot(X, Y)))**2)
 
 
+def get_error_sparse(A, X, Y, W=None, chunk_size=2**16):
+    """`get_error` on the observed (stored) entries of A only, O(nnz k)
+
+    A: sparse observation matrix
+    W: weights of the entries of A (sparse, same pattern as A), default to ones,
+        the error being the ALS objective \sum W[u, i] (A[u, i] - x_u y_i)^2
+    """
+    A = A.tocoo()
+    if W is not None:
+        W = W.tocoo()
+        assert (W.row == A.row).all() and (W.col == A.col).all()
+    error = 0.
+    for start in range(0, A.nnz, chunk_size):
+        rows = A.row[start:start + chunk_size]
+        cols = A.col[start:start + chunk_size]
+        pred = np.einsum('ij,ji->i', X[rows], Y[:, cols])
+        residuals = (A.data[start:start + chunk_size] - pred)**2
+        if W is not None:
+            residuals *= W.data[start:start + chunk_size]
+        error += np.sum(residuals)
+    return error
+
+
+def als_update(A, W, F, lambda_, batch_size=2**12, n_jobs=1):
+    """
+    One half step of ALS: the rows x_u minimizing, for every u,
+
+    \sum_i W[u, i] (A[u, i] - x_u f_i)^2 + lambda_ |x_u|^2
+
+    i.e. x_u = (F^T diag(W[u]) F + lambda_ I)^{-1} F^T diag(W[u]) A[u]^T,
+    all the k x k systems of a batch of rows being solved at once.
+    The Gram matrices only sum over the stored entries of W, gathering the rows of F
+    a batch observes: O(nnz k^2) time and O(batch_nnz k + batch_size k^2) extra memory.
+
+    Args:
+
+    A: observations (csr, n x m), zero where not observed
+    W: observation weights (csr, n x m), same pattern as A
+    F: the fixed factor (m x k)
+    lambda_: regularization term weight, scalar or one per row
+    batch_size: number of rows solved at once
+    n_jobs: number of threads the batches are spread over (-1 for all cores),
+        they share A, W, F and the output
+
+    Returns:
+    X: n x k
+    """
+    n, k = A.shape[0], F.shape[1]
+    WA = W.multiply(A).tocsr()
+    lambda_ = np.broadcast_to(np.asarray(lambda_, dtype=np.float64), (n, ))
+
+    X = np.empty((n, k))
+
+    def solve_batch(start):
+        end = min(start + batch_size, n)
+        W_batch = W[start:end]
+        F_batch = F[W_batch.indices]
+        # sums the entries of each row: G[u] = sum_i W[u, i] f_i^T f_i
+        W_entries = csr_matrix(
+            (W_batch.data, np.arange(W_batch.nnz), W_batch.indptr),
+            shape=(end - start, W_batch.nnz))
+        G = np.empty((end - start, k, k))
+        for a in range(k):
+            G[:, a, a:] = W_entries.dot(F_batch[:, a, None] * F_batch[:, a:])
+            G[:, a + 1:, a] = G[:, a, a + 1:]
+        G += lambda_[start:end, None, None] * np.eye(k)
+        b = WA[start:end].dot(F)
+        X[start:end] = np.linalg.solve(G, b[:, :, None])[:, :, 0]
+
+    starts = range(0, n, batch_size)
+    n_threads = min(n_workers(n_jobs), len(starts))
+    if n_threads > 1:
+        pool = ThreadPool(n_threads)
+        try:
+            pool.map(solve_batch, starts)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for start in starts:
+            solve_batch(start)
+    return X
+
+
+INIT_METHODS = {'random', 'svd', 'randomized', 'lanczos'}
+
+
+def init_factors(Q, k, init_method):
+    """
+    Q: observation matrix (dense or sparse)
+    init_method:
+        - 'random': uniform in [-1, 1]
+        - 'svd': full SVD of the dense Q ('lanczos' if Q is sparse)
+        - 'randomized': top-k SVD by a randomized range finder
+          (sklearn randomized_svd, a few passes over Q)
+        - 'lanczos': top-k SVD by scipy svds
+        the truncated SVD U S V^T being split as X = U S^{1/2}, Y = S^{1/2} V^T
+
+    Returns:
+    X (n x k), Y (k x m)
+    """
+    assert init_method in INIT_METHODS
+    if init_method == 'svd' and sparse.issparse(Q):
+        init_method = 'lanczos'
+
+    if init_method == 'random':
+        X = np.random.uniform(-1, 1, (Q.shape[0], k))
+        Y = np.random.uniform(-1, 1, (k, Q.shape[1]))
+    elif init_method in {'randomized', 'lanczos'}:
+        if init_method == 'randomized':
+            U, s, Vt = randomized_svd(Q, k, n_iter=4,
+                                      random_state=np.random.randint(2**31 - 1))
+        else:
+            if not sparse.issparse(Q):
+                Q = csr_matrix(Q)
+            U, s, Vt = linalg.svds(Q.astype(np.float64), k=k)
+        s = np.sqrt(s)
+        X, Y = U * s, s[:, None] * Vt
+    else:
+        U, s, Vt = np.linalg.svd(Q, full_matrices=False)
+        s = np.sqrt(s[:k])
+        X, Y = U[:, :k] * s, s[:, None] * Vt[:k]
+    return X, Y
+
+
 def alq_with_weight(Q, W, k, **kwargs):
-    """W (weight matrix doesn't matter)
-    wrapper to make interface consistant
+    """weighted `alq`, W being the confidence of each observation
     """
-    return alq(Q, k, **kwargs)
+    return alq(Q, k, W=W, **kwargs)
 
 
 def alq(Q, k, lambda_, max_iter,
         init_method='random',
-        verbose=True):
+        verbose=True,
+        warm_start=None,
+        method='batched',
+        batch_size=2**12,
+        tol=None,
+        validation=None,
+        return_trace=False,
+        W=None):
     """
-    Q: observation matrix
+    Q: observation matrix (dense, or sparse for the batched method),
+        the zero entries being unobserved
     k: low-rank dimension
     lambda_: regularization term weight
+    init_method: see `init_factors`
+    warm_start: dict, the factors 'X' and 'Y' of the previous run (if any, of the right shapes)
+        are used in place of `init_method`, the new factors are stored back
+    method: 'batched' (see `als_update`, O(nnz k^2) per iteration)
+        or 'loop' (one dense solve per row/column, O(n^3) per iteration)
+    batch_size: number of rows solved at once by the batched method
+    tol, validation, return_trace: stopping rules and trace (see `als_iterations`)
+    W: confidence of each observation (dense or sparse, default to ones),
+        the weighted error being \sum W[u, i] (Q[u, i] - x_u y_i)^2 over the observations
+
+    Returns:
+    X, Y, the weighted error of each iteration (and the trace if return_trace)
+    """
+    assert init_method in INIT_METHODS
+    assert method in {'batched', 'loop'}
+
+    if (warm_start
+        and warm_start.get('X') is not None
+        and warm_start['X'].shape == (Q.shape[0], k)
+        and warm_start['Y'].shape == (k, Q.shape[1])):
+        X = warm_start['X'].copy()
+        Y = warm_start['Y'].copy()
+    else:
+        X, Y = init_factors(Q, k, init_method)
+
+    if method == 'batched':
+        A, W, A_t, W_t = _observations(Q, W)
+
+        def sweep(X, Y):
+            X = als_update(A, W, Y.T, lambda_, batch_size)
+            Y = als_update(A_t, W_t, X, lambda_, batch_size).T
+            return X, Y
+
+        def error(X, Y):
+            return get_error_sparse(A, X, Y, W)
+    else:
+        if sparse.issparse(Q):
+            Q = Q.toarray()
+        if W is None:
+            W = np.sign(np.abs(Q))
+        else:
+            W = np.sign(np.abs(Q)) * (W.toarray() if sparse.issparse(W) else W)
+
+        def sweep(X, Y):
+            for u, Wu in enumerate(W):
+                X[u] = np.linalg.solve(
+                    np.dot(Y, np.dot(np.diag(Wu), Y.T)) + lambda_ * np.eye(k),
+                    np.dot(Y, np.dot(np.diag(Wu), Q[u].T))).T
+            for i, Wi in enumerate(W.T):
+                Y[:, i] = np.linalg.solve(
+                    np.dot(X.T, np.dot(np.diag(Wi), X)) + lambda_ * np.eye(k),
+                    np.dot(X.T, np.dot(np.diag(Wi), Q[:, i])))
+            return X, Y
+
+        def error(X, Y):
+            return get_error(Q, X, Y, np.sqrt(W))
+
+    X, Y, trace = als_iterations(sweep, error, X, Y, max_iter,
+                                 tol=tol, validation=validation,
+                                 verbose=verbose)
+
+    if warm_start is not None:
+        warm_start['X'], warm_start['Y'] = X, Y
+    if return_trace:
+        return X, Y, trace['error'], trace
+    return X, Y, trace['error']
+
+
+def als_iterations(sweep, error, X, Y, max_iter,
+                   tol=None, validation=None, verbose=True):
     """
-    assert init_method in {'random', 'svd'}
+    Run ALS sweeps until max_iter, or earlier:
 
-    if init_method == 'random':
-        X = np.random.uniform(-1, 1, (Q.shape[0], k))
-        Y = np.random.uniform(-1, 1, (k, Q.shape[1]))
-    elif init_method == 'svd':
-        X, _, Y = np.linalg.svd(Q)
-        X = X[:, :k]
-        Y = np.transpose(Y[:, :k])
+    - tol: when the relative decrease of the error, (e_{t-1} - e_t) / e_{t-1},
+      falls below tol
+    - validation: held-out observations (sparse, zero meaning not held out),
+      when their error (see `get_error_sparse`) stops decreasing,
+      the factors of the best validation error being returned
+
+    Args:
 
-    W = np.sign(np.abs(Q))
+    sweep: function (X, Y) -> (X, Y), one ALS iteration
+    error: function (X, Y) -> weighted training error
+    X, Y: initial factors
 
-    weighted_errors = []
+    Returns:
+    X, Y
+    trace: dict of per-iteration lists, 'error', 'validation_error' (if validation)
+        and 'time' (seconds since the start)
+    """
+    trace = {'error': [], 'time': []}
+    if validation is not None:
+        validation = sparse.coo_matrix(validation)
+        trace['validation_error'] = []
+        best = None
+
+    start = time.time()
     for ii in range(max_iter):
-        for u, Wu in enumerate(W):
-            X[u] = np.linalg.solve(
-                np.dot(Y, np.dot(np.diag(Wu), Y.T)) + lambda_ * np.eye(k),
-                np.dot(Y, np.dot(np.diag(Wu), Q[u].T))).T
-        for i, Wi in enumerate(W.T):
-            Y[:, i] = np.linalg.solve(
-                np.dot(X.T, np.dot(np.diag(Wi), X)) + lambda_ * np.eye(k),
-                np.dot(X.T, np.dot(np.diag(Wi), Q[:, i])))
-        error = get_error(Q, X, Y, W)
-        weighted_errors.append(error)
+        X, Y = sweep(X, Y)
+        e = error(X, Y)
+        trace['error'].append(e)
+        trace['time'].append(time.time() - start)
         if verbose:
-            print('{}th iteration, weighted error{}'.format(ii, error))
+            print('{}th iteration, weighted error{}'.format(ii, e))
+
+        if validation is not None:
+            e_val = get_error_sparse(validation, X, Y)
+            trace['validation_error'].append(e_val)
+            if verbose:
+                print('{}th iteration, validation error{}'.format(ii, e_val))
+            if best is None or e_val < best[0]:
+                best = (e_val, X.copy(), Y.copy())
+            else:
+                _, X, Y = best
+                break
+
+        if (tol is not None and ii > 0
+            and trace['error'][-2] - e <= tol * trace['error'][-2]):
+            break
+    return X, Y, trace
+
+
+def _observations(Q, W=None):
+    """
+    Q: observation matrix, zero meaning unobserved
+    W: weights (dense or sparse) of the observations (default to ones),
+        observations of weight zero being dropped
 
-    return X, Y, weighted_errors
+    Returns:
+    A, W, A^T, W^T: the observations and their weights (csr, same pattern)
+    """
+    A = csr_matrix(Q, dtype=np.float64)
+    A.eliminate_zeros()
+    A.sort_indices()
+    if W is None:
+        weights = np.ones(A.nnz)
+    else:
+        rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+        weights = np.asarray(W[rows, A.indices], dtype=np.float64).ravel()
+        assert (weights >= 0).all(), 'negative weights'
+        if not weights.all():
+            keep = (weights != 0)
+            A = csr_matrix((A.data[keep], (rows[keep], A.indices[keep])),
+                           shape=A.shape)
+            weights = weights[keep]
+    W = csr_matrix((weights, A.indices, A.indptr), shape=A.shape)
+    return A, W, A.T.tocsr(), W.T.tocsr()
 
 
-# DEPRECATED
 def alq_weighted_spark(A, W, k, sc, **kwargs):
-    """wrapper to make interface consistant
+    """weighted `alq_spark`
+
+    MLlib ALS has no per-rating weights,
+    so unless W is None, the factorization runs locally (see `als_factors`)
     """
-    return alq_spark(A, k, sc, **kwargs)
+    return als_factors(A, k, sc, W=W, **kwargs)
 
 
-def alq_spark(A, k, sc, **kwargs):
+def alq_spark(A, k, sc, warm_start=None, **kwargs):
     """
     Args:
     
     - A: sign matrix (csr_matrix)
     - k: number of clusters
     - sc: the spark context
+    - warm_start: dict, the factors are stored as 'X' and 'Y'
+        (MLlib ALS cannot start from given factors, so they are not used as initialization)
     - kwargs: parameters for ALS.train except for ratings
         https://spark.apache.org/docs/1.5.1/api/python/pyspark.mllib.html#pyspark.mllib.recommendation.ALS.train
 
@@ -85,6 +343,8 @@ def alq_spark(A, k, sc, **kwargs):
     X: np.ndarray (n x k)
     Y: np.ndarray (k x n)
     """
+    from pyspark.mllib.recommendation import ALS
+
     edges = indexed_entries(A)
     
     edges_rdd = sc.parallelize(edges)
@@ -99,71 +359,343 @@ def alq_spark(A, k, sc, **kwargs):
     X = np.array(list(zip(*X))[1])
     Y = np.transpose(np.array(list(zip(*Y))[1]))
 
+    if warm_start is not None:
+        warm_start['X'], warm_start['Y'] = X, Y
     return X, Y
 
 
-def weighted_partition_sparse(A, W, k, sc, **kwargs):
-    """wrapper
+def alq_local(A, k, iterations=5, lambda_=0.01, seed=None,
+              n_jobs=-1, batch_size=2**12, warm_start=None,
+              tol=None, validation=None, W=None):
     """
-    return partition_sparse(A, k, sc, **kwargs)
+    Local (no Spark) replacement of `alq_spark`, taking the same parameters as ALS.train
+
+    As MLlib ALS, the regularization of each row/column is
+    lambda_ times its number of observations (at least one),
+    and the initial factors are random unit vectors.
+    The half steps are `als_update` over a thread pool.
+
+    Args:
+
+    - A: sign matrix (sparse or dense, zero meaning unobserved)
+    - k: number of clusters (the rank)
+    - iterations, lambda_, seed: as in ALS.train
+    - n_jobs: number of threads (-1 for all cores)
+    - batch_size: number of rows solved at once
+    - warm_start: dict, the factors 'X' and 'Y' of the previous run (if any, of the right shapes)
+        are used as initialization, the new factors are stored back
+    - tol, validation: early stopping (see `als_iterations`)
+    - W: confidence of each entry of A (dense or sparse, default to ones)
+
+    Return:
+
+    X: np.ndarray (n x k)
+    Y: np.ndarray (k x n)
+    """
+    A, W, A_t, W_t = _observations(A, W)
+    n, m = A.shape
+
+    if (warm_start
+        and warm_start.get('X') is not None
+        and warm_start['X'].shape == (n, k)
+        and warm_start['Y'].shape == (k, m)):
+        Y = warm_start['Y']
+    else:
+        rng = np.random.RandomState(seed)
+        Y = rng.normal(size=(m, k))
+        Y /= np.maximum(np.linalg.norm(Y, axis=1), 1e-12)[:, None]
+        Y = Y.T
+
+    # as for MLlib, the rows/columns with no observation stay solvable (and zero)
+    lambda_rows = lambda_ * np.maximum(np.diff(W.indptr), 1)
+    lambda_cols = lambda_ * np.maximum(np.diff(W_t.indptr), 1)
+
+    def sweep(X, Y):
+        X = als_update(A, W, Y.T, lambda_rows, batch_size, n_jobs)
+        Y = als_update(A_t, W_t, X, lambda_cols, batch_size, n_jobs).T
+        return X, Y
+
+    X, Y, _ = als_iterations(sweep, lambda X, Y: get_error_sparse(A, X, Y, W),
+                             None, Y, iterations,
+                             tol=tol, validation=validation, verbose=False)
+
+    if warm_start is not None:
+        warm_start['X'], warm_start['Y'] = X, Y
+    return X, Y
 
 
-def partition_sparse(A, k, sc, **kwargs):
+def _sum_by_index(idx, values):
+    """
+    Returns:
+    the distinct indices and the sums of the rows of values for each of them
+    """
+    order = np.argsort(idx, kind='mergesort')
+    idx = idx[order]
+    starts = np.concatenate([[0], np.nonzero(np.diff(idx))[0] + 1])
+    return idx[starts], np.add.reduceat(values[order], starts, axis=0)
+
+
+def _stream_shape(edges, block_size):
+    n_rows, n_cols = 0, 0
+    for start in range(0, len(edges), block_size):
+        block = np.asarray(edges[start:start + block_size, :2])
+        n_rows = max(n_rows, int(block[:, 0].max()) + 1)
+        n_cols = max(n_cols, int(block[:, 1].max()) + 1)
+    return n_rows, n_cols
+
+
+def sgd_factors(edges, k, shape=None, lambda_=0.01,
+                learning_rate=0.1, method='adagrad',
+                epochs=10, batch_size=2**10, block_size=2**20,
+                seed=None, checkpoint=None, verbose=True):
+    """
+    Streaming matrix completion by minibatch SGD (or AdaGrad) on
+
+    \sum_{(u, i)} (A[u, i] - x_u y_i)^2 + lambda_ (|x_u|^2 + |y_i|^2)
+
+    reading the observations block by block from an edge array,
+    typically memory-mapped, so that only the factors and one block are in memory.
+    Each epoch visits the blocks in random order, and each block in random order.
+
+    Args:
+
+    edges: int array (m, 3) of (row_id, col_id, value), e.g. the file written by
+        `snpp.utils.matrix.save_edges` opened by `np.load(path, mmap_mode='r')`
+    k: low-rank dimension
+    shape: (n_rows, n_cols), default to one pass over the edges
+    lambda_: regularization term weight
+    learning_rate: step size (initial step size for AdaGrad)
+    method: 'sgd' or 'adagrad' (per coordinate step sizes)
+    epochs: number of passes over the edges
+    batch_size: number of observations per update
+    block_size: number of edges read at once
+    seed: random seed of the initialization and the shuffling
+    checkpoint: path of a .npz file the factors (and optimizer state) are saved to
+        after every epoch, and resumed from if it exists
+
+    Returns:
+    X: np.ndarray (n x k)
+    Y: np.ndarray (k x m)
+    """
+    assert method in {'sgd', 'adagrad'}
+    if shape is None:
+        shape = _stream_shape(edges, block_size)
+    n_rows, n_cols = shape
+    rng = np.random.RandomState(seed)
+
+    X = rng.normal(scale=0.1, size=(n_rows, k))
+    Yt = rng.normal(scale=0.1, size=(n_cols, k))
+    G_X, G_Y = np.zeros((n_rows, k)), np.zeros((n_cols, k))  # AdaGrad accumulators
+    first_epoch = 0
+    if checkpoint is not None and os.path.exists(checkpoint):
+        saved = np.load(checkpoint)
+        X, Yt, G_X, G_Y = saved['X'], saved['Y'].T.copy(), saved['G_X'], saved['G_Y']
+        first_epoch = int(saved['epoch']) + 1
+        rng.set_state(tuple(saved['rng_state_' + str(i)][()] for i in range(5)))
+        if verbose:
+            print('resuming from epoch {} ({})'.format(first_epoch, checkpoint))
+
+    def step(F, G, idx, grad):
+        idx, grad = _sum_by_index(idx, grad)
+        if method == 'adagrad':
+            G[idx] += grad ** 2
+            F[idx] -= learning_rate * grad / (np.sqrt(G[idx]) + 1e-8)
+        else:
+            F[idx] -= learning_rate * grad
+
+    n_edges = len(edges)
+    for epoch in range(first_epoch, epochs):
+        error = 0.
+        for block_start in rng.permutation(np.arange(0, n_edges, block_size)):
+            block = np.asarray(edges[block_start:block_start + block_size])
+            block = block[rng.permutation(len(block))]
+            for start in range(0, len(block), batch_size):
+                rows = block[start:start + batch_size, 0]
+                cols = block[start:start + batch_size, 1]
+                values = block[start:start + batch_size, 2]
+                x, y = X[rows], Yt[cols]
+                residuals = values - np.einsum('ij,ij->i', x, y)
+                error += np.sum(residuals ** 2)
+                # gradients are averaged over the batch
+                scale = 2. / len(rows)
+                step(X, G_X, rows, scale * (lambda_ * x - residuals[:, None] * y))
+                step(Yt, G_Y, cols, scale * (lambda_ * y - residuals[:, None] * x))
+        if verbose:
+            print('{}th epoch, error{}'.format(epoch, error))
+
+        if checkpoint is not None:
+            state = rng.get_state()
+            tmp = checkpoint + '.tmp.npz'
+            np.savez(tmp, X=X, Y=Yt.T, G_X=G_X, G_Y=G_Y, epoch=epoch,
+                     **{'rng_state_' + str(i): np.asarray(v) for i, v in enumerate(state)})
+            os.replace(tmp, checkpoint)
+
+    return X, Yt.T
+
+
+def als_factors(A, k, sc=None, W=None, **kwargs):
+    """`alq_spark` if a spark context is given and the observations are unweighted,
+    else `alq_local`
+
+    W: confidence of each entry of A (None for unweighted)
+    """
+    if sc is None or W is not None:
+        return alq_local(A, k, W=W, **kwargs)
+    return alq_spark(A, k, sc, **kwargs)
+
+
+def weighted_partition_sparse(A, W, k, sc=None, **kwargs):
+    """`partition_sparse` with the confidence W of each entry of A
+    """
+    return partition_sparse(A, k, sc, W=W, **kwargs)
+
+
+def partition_sparse(A, k, sc=None, warm_start=None, **kwargs):
     """
     Args:
 
     - A: sparse matrix
-    - sc: spark context
+    - sc: spark context (None for the local backend, see `als_factors`)
+    - warm_start: dict of state kept across calls (see `partition_graph`)
 
     Return:
 
     - cluster labels
     """
-    X, Y = alq_spark(A, k, sc, **kwargs)
+    X, Y = als_factors(A, k, sc, warm_start=warm_start, **kwargs)
 
-    A_p = np.dot(X, Y)
-    _, labels = predict_cluster_labels(A_p, k, order='desc')
+    # eigenvectors of X Y, without forming it
+    _, labels = predict_cluster_labels_factors(X, Y, k,
+                                               warm_start=warm_start)
     return labels
 
 
-def partition_graph_slow(g, k, sc, **kwargs):
+def graph2matrix(g):
+    """sign matrix (csr) with ones on the diagonal, row/column i being node i
+    (so that the labels are indexed by node)
+
+    g: nx.Graph or SignedGraph (whose CSR snapshot is used without conversion)
+    """
+    return fill_diagonal(g2csr(g))
+
+
+def partition_graph_slow(g, k, sc=None, **kwargs):
     """
     Args:
 
     - A: sparse matrix
-    - sc: spark context
+    - sc: spark context (None for the local backend, see `als_factors`)
 
     Return:
 
     - cluster labels
     """
-    A = nx.to_scipy_sparse_matrix(g, nodelist=g.nodes(),
-                                  weight='sign', format='csr')
-    A = fill_diagonal(A)
+    A = graph2matrix(g)
     print(A.toarray())
     return partition_sparse(A, k, sc, **kwargs)
 
 
-def partition_graph(g, k, sc, **kwargs):
+def partition_graph(g, k, sc=None, warm_start=None, **kwargs):
     """takes graph as input
+
+    sc: spark context, None for the local backend (see `als_factors`)
+    warm_start: dict of state kept across calls, e.g. by `iterative_approach`
+        (the factors 'X', 'Y', the labels 'C' and the KMeans 'centroids'),
+        KMeans starts from the previous clusters
+        (and the local ALS from the previous factors)
+    kwargs: ALS parameters (iterations, lambda_, seed...)
     """
     print('to_scipy_sparse_matrix')
-    A = nx.to_scipy_sparse_matrix(g, nodelist=g.nodes(),
-                                  weight='sign', format='csr')
-    A = fill_diagonal(A)
+    A = graph2matrix(g)
     
     print('ALS...')
-    U, _ = alq_spark(A, k, sc, **kwargs)
+    U, _ = als_factors(A, k, sc, warm_start=warm_start, **kwargs)
     assert U.shape == (A.shape[0], k), "{} != {}".format(
         U.shape, (A.shape[0], k))
     
     print('predict labels (SVD + Kmeans)...')
-    _, labels = predict_cluster_labels_svd(U, k, order='desc')
+    _, labels = predict_cluster_labels_svd(U, k, order='desc',
+                                           warm_start=warm_start)
 
     return labels
 
 
-def predict_signs(X, Y, targets, sc):
+def predict_signs_chunked(X, Y, targets, chunk_size=2**16, n_jobs=1,
+                          return_scores=False,
+                          signs_out=None, scores_out=None):
+    """
+    sign(X[i] . Y[:, j]) for the targets (i, j), one chunk of targets at a time
+
+    Only the chunks being scored are in memory besides X and Y,
+    so the targets can be a memory-mapped file, e.g. `np.load(path, mmap_mode='r')`,
+    and the outputs memory-mapped too (`np.lib.format.open_memmap`).
+
+    Args:
+
+    X: n x k
+    Y: k x m
+    targets: int array (m, 2), or (rows, cols) arrays
+    chunk_size: number of targets scored at once
+    n_jobs: number of threads the chunks are spread over (-1 for all cores)
+    return_scores: also return the raw scores X[i] . Y[:, j] (e.g. for ranking)
+    signs_out, scores_out: arrays the results are written into (default to new arrays)
+
+    Returns:
+    signs: int8 array, in the order of the targets
+    scores: float array (if return_scores)
+    """
+    if isinstance(targets, tuple):
+        rows, cols = targets
+    else:
+        rows, cols = targets[:, 0], targets[:, 1]
+    m = len(rows)
+    Yt = np.ascontiguousarray(Y.T)
+
+    if signs_out is None:
+        signs_out = np.empty(m, dtype=np.int8)
+    if return_scores and scores_out is None:
+        scores_out = np.empty(m, dtype=np.float64)
+
+    def score_chunk(start):
+        end = min(start + chunk_size, m)
+        r = np.asarray(rows[start:end], dtype=np.int64)
+        c = np.asarray(cols[start:end], dtype=np.int64)
+        scores = np.einsum('ij,ij->i', X[r], Yt[c])
+        signs_out[start:end] = np.sign(scores)
+        if return_scores:
+            scores_out[start:end] = scores
+
+    starts = range(0, m, chunk_size)
+    n_threads = min(n_workers(n_jobs), len(starts))
+    if n_threads > 1:
+        pool = ThreadPool(n_threads)
+        try:
+            pool.map(score_chunk, starts)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for start in starts:
+            score_chunk(start)
+
+    if return_scores:
+        return signs_out, scores_out
+    return signs_out
+
+
+def predict_signs(X, Y, targets, sc=None):
+    """
+    sign of X[i] . Y[:, j] for (i, j) in targets,
+    computed by spark if sc is given (else by `predict_signs_chunked`)
+
+    Returns:
+    list of (i, j, sign)
+    """
+    if sc is None:
+        targets = np.asarray(list(targets), dtype=np.int64).reshape(-1, 2)
+        signs = predict_signs_chunked(X, Y, targets)
+        return list(zip(targets[:, 0].tolist(), targets[:, 1].tolist(),
+                        signs.tolist()))
     Xb, Yb = sc.broadcast(X), sc.broadcast(np.transpose(Y))
     preds = sc.parallelize(targets).map(
         lambda e: (e[0], e[1], np.sign(np.dot(Xb.value[e[0]], Yb.value[e[1]])))
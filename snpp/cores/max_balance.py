@@ -6,7 +6,11 @@ from copy import copy
 from .triangle import first_order_triangles_count, \
     first_order_triangles_count_g, \
     first_order_triangles_net_count_g, \
-    build_edge2edges
+    first_order_triangles_net_count_csr, \
+    build_edge2edges_csr, \
+    Edge2Edges
+from ..utils.signed_graph import g2csr, SignedGraph
+from ..utils.priority_queue import BucketQueue
 
 
 def edge_weight_sum(edges, W):
@@ -103,22 +107,27 @@ def greedy_g(g, C, B, T):
     return preds
 
 
-def faster_greedy(g, C, B, T, edge2edges=None, edge2true_sign=None):
+def faster_greedy(g, C, B, T, edge2edges=None, edge2true_sign=None,
+                  n_jobs=1, triangle_cache=None):
     """
     Faster version that computes the triangle count only when necessary
 
     Args:
     
-    g: signed network
+    g: signed network (nx.Graph or SignedGraph, not modified)
     C: cluster label array
     B: budget
     T: set of target edges (node i, node j)
     edge2edges: dict of edge to set edges, each of which are in some triangle with the key edge
+        (or the equivalent `Edge2Edges`)
+    n_jobs: number of processes for the initial triangle count and edge2edges (-1 for all cores)
+    triangle_cache: TriangleCountCache kept across calls (over all the targets),
+        only the targets affected by the graph/partition changes since the last call are recounted
 
     Returns:
     predictions: (i, j, sign)
     """
-    assert isinstance(g, nx.Graph)
+    assert isinstance(g, (nx.Graph, SignedGraph))
     
     assert isinstance(T, set)
     targets = copy(T)
@@ -129,25 +138,33 @@ def faster_greedy(g, C, B, T, edge2edges=None, edge2true_sign=None):
 
     print('building triangle_count_by_edge')
     triangle_count_by_edge = {}  # needs to be updated on the fly
-    for n1, n2, s, sc, ck, info in first_order_triangles_net_count_g(g, C, targets):
+    A = g2csr(g)
+    # the predictions are added to a copy that shares the CSR arrays
+    g = (g.copy() if isinstance(g, SignedGraph) else SignedGraph(A))
+    if triangle_cache is None:
+        counts = first_order_triangles_net_count_csr(A, C, targets, n_jobs=n_jobs)
+    else:
+        triangle_cache.update(A, C)
+        counts = triangle_cache.net_count(targets)
+    for n1, n2, s, sc, ck, info in counts:
         triangle_count_by_edge[(n1, n2)] = (s, sc, ck, info)
 
     if edge2edges is None:
-        g = g.copy()
-        edge2edges = build_edge2edges(g, T)
+        edge2edges = build_edge2edges_csr(A, T, n_jobs=n_jobs)
     else:
         print('edge2edges (size {}) is given'.format(len(edge2edges)))
-        assert isinstance(edge2edges, dict)
+        assert isinstance(edge2edges, (dict, Edge2Edges))
 
-    while True:
-        budget_used = sum(g[i][j].get('weight', 1) for i, j in T_p)
-        if (budget_used >= B or len(targets) <= 0):
-            break
+    # keyed by net count, ties are broken by the iteration order of `targets`
+    # (the first best edge, as `max(targets, ...)` would return)
+    queue = BucketQueue()
+    for rank, e in enumerate(targets):
+        queue.push(e, triangle_count_by_edge[e][1], rank)
 
+    budget_used = 0
+    while budget_used < B and len(queue) > 0:
         # find best edge
-        # can use a heap here
-        best_e = max(targets,
-                     key=lambda k: triangle_count_by_edge[k][1])
+        best_e, _ = queue.pop()
         best_s, nc, ck, info = triangle_count_by_edge[best_e]
 
         if edge2true_sign:
@@ -160,19 +177,22 @@ def faster_greedy(g, C, B, T, edge2edges=None, edge2true_sign=None):
             
         ))
 
-        # update triangle information on affected edges
-        # only consider un-predicted edges
-        affected_edges = list(filter(lambda e: e not in T_p,
-                                     edge2edges[(n1, n2)]))
-        
-        for i, j, s, nc, ck, info in first_order_triangles_net_count_g(g, C, affected_edges):
-            triangle_count_by_edge[(i, j)] = (s, nc, ck, info)
-
         # gather result
         T_p.add(best_e)
         targets.remove(best_e)
 
         n1, n2 = best_e
         g.add_edge(n1, n2, weight=1, sign=best_s)
+        budget_used += 1
         preds.append((n1, n2, best_s))
+
+        # update triangle information on affected edges (with the new sign)
+        # only consider un-predicted edges
+        affected_edges = list(filter(lambda e: e not in T_p,
+                                     edge2edges[best_e]))
+
+        for i, j, s, nc, ck, info in first_order_triangles_net_count_g(g, C, affected_edges):
+            triangle_count_by_edge[(i, j)] = (s, nc, ck, info)
+            if (i, j) in queue:
+                queue.push((i, j), nc)
     return preds
@@ -1,8 +1,13 @@
+import os
+import hashlib
 import numpy as np
 import scipy
-from scipy.sparse import issparse, dia_matrix
+from functools import partial
+from scipy.sparse import issparse, dia_matrix, diags, csr_matrix
+from scipy.sparse.linalg import eigsh, lobpcg
 from sklearn.cluster import KMeans
-from ..utils.matrix import indexed_entries, _make_matrix
+from sklearn.utils import check_random_state
+from ..utils.parallel import n_workers, map_shards, worker_arrays
 
 
 def build_laplacian_related_matrices(W):
@@ -18,13 +23,18 @@ def build_laplacian_related_matrices(W):
 
 def build_laplacian_related_matrices_sparse(W):
     """W: the sign matrix (sparse)
+
+    W_p and W_n are csr, split from W's data by sign (no python-level loop)
     """
     assert issparse(W)
 
-    entries = list(indexed_entries(W))
-    W_p = _make_matrix(list(filter(lambda e: e[2] > 0, entries)), W.shape)
-    W_n = _make_matrix(list(filter(lambda e: e[2] < 0, entries)), W.shape)
-    W_n = -W_n
+    W = W.tocsr()
+    W_p = W.copy()
+    W_p.data = np.maximum(W_p.data, 0)
+    W_p.eliminate_zeros()
+    W_n = W.copy()
+    W_n.data = - np.minimum(W_n.data, 0)
+    W_n.eliminate_zeros()
 
     D_p = dia_matrix((np.transpose(W_p.sum(axis=1)), [0]), W.shape)
     D_n = dia_matrix((np.transpose(W_n.sum(axis=1)), [0]), W.shape)
@@ -32,11 +42,76 @@ def build_laplacian_related_matrices_sparse(W):
     return W_p, W_n, D_p, D_n, D_hat
 
 
-def predict_cluster_labels_svd(M, k, order):
+def inverse_degree(D):
+    """D: diagonal degree matrix (sparse)
+
+    return:
+    sparse diagonal matrix of 1 / d, with 0 for the nodes of degree 0
+    (scaling by it replaces `np.linalg.inv(D)`)
+    """
+    d = np.asarray(D.diagonal(), dtype=np.float64)
+    d_inv = np.zeros_like(d)
+    d_inv[d != 0] = 1 / d[d != 0]
+    return diags(d_inv, format='csr')
+
+
+def warm_start_centroids(X, k, warm_start):
+    """
+    Initial KMeans centroids from the previous run
+
+    The centroids are the means of the rows of X over the previous clusters 'C'
+    (which does not depend on the basis of the embedding),
+    else the previous 'centroids' if they fit X.
+
+    Returns:
+    array (k, X.shape[1]) or None (no usable warm start)
+    """
+    if not warm_start:
+        return None
+    C = warm_start.get('C')
+    if C is not None and len(C) == X.shape[0]:
+        if isinstance(C, dict):
+            C = [C[i] for i in range(X.shape[0])]
+        _, codes = np.unique(np.asarray(C), return_inverse=True)
+        if codes.max() + 1 == k:
+            sizes = np.bincount(codes, minlength=k)
+            centroids = np.zeros((k, X.shape[1]), dtype=X.dtype)
+            np.add.at(centroids, codes, X)
+            return centroids / sizes[:, None]
+    centroids = warm_start.get('centroids')
+    if centroids is not None and centroids.shape == (k, X.shape[1]):
+        return centroids
+    return None
+
+
+def kmeans(X, k, warm_start=None, **kwargs):
+    """
+    KMeans on the embedding X, started from the previous clusters if possible
+    (see `warm_start_centroids`)
+
+    warm_start: dict (read and updated) or None
+    kwargs: passed to KMeans
+
+    Returns:
+    model and predicted cluster labels
+    """
+    init = warm_start_centroids(X, k, warm_start)
+    if init is not None:
+        kwargs.update(init=init, n_init=1)
+    model = KMeans(n_clusters=k, **kwargs)
+    pred_y = model.fit_predict(X)
+    if warm_start is not None:
+        warm_start['C'] = pred_y
+        warm_start['centroids'] = model.cluster_centers_
+    return model, pred_y
+
+
+def predict_cluster_labels_svd(M, k, order, warm_start=None):
     """
     for non-square matrices
 
     M: mxn matrix, for exmample the Laplacian
+    warm_start: dict of the previous labels 'C' and 'centroids' (see `kmeans`)
     """
     U, s, vh = scipy.linalg.svd(M, full_matrices=False)
     print('eigen values: {}'.format(s[:k]))
@@ -45,38 +120,317 @@ def predict_cluster_labels_svd(M, k, order):
     else:
         X = U[:, -k:]
     
-    model = KMeans(n_clusters=k, n_jobs=-1, n_init=8)
-    pred_y = model.fit_predict(X)
-    return model, pred_y
+    return kmeans(X, k, warm_start, n_jobs=-1, n_init=8)
 
 
-def predict_cluster_labels(L, k, order):
-    """L: the laplacian matrix
-    k: the k in top-k eigen vectors
+EIGEN_SOLVERS = {'eig', 'eigsh', 'lobpcg'}
+
+
+def top_k_eigenvectors(L, k, order, solver='eigsh', shift_invert=False, sigma=-1e-3,
+                       V0=None, tol=None, maxiter=None, random_state=None):
+    """
+    The k smallest ('asc') or largest ('desc') eigen pairs of the symmetric matrix L,
+    in O(nnz k) per iteration instead of the O(n^3) full decomposition
+
+    L: symmetric matrix (sparse, dense or LinearOperator),
+        for example the signed laplacian `kunegis2010.build_L_sparse`
+        (checked unless a LinearOperator)
+    solver:
+        - 'eigsh': ARPACK (Lanczos)
+        - 'lobpcg': block method, best with a good initial block V0
+    shift_invert: for 'asc' with 'eigsh', find the eigenvalues closest to sigma
+        by factorizing L - sigma I: few iterations for the bottom of the spectrum,
+        but the LU factorization can fill in on well-connected graphs
+    sigma: the shift, a bit below 0 as the laplacians are positive semi-definite
+        (L - 0 I is singular on balanced graphs)
+    V0: n x k' initial eigenvectors, for example from a previous run on a close matrix;
+        'eigsh' starts from their sum, 'lobpcg' from the block (completed with random vectors)
+    tol, maxiter: passed to the solver
+    random_state: seed of the random initial block for 'lobpcg'
 
     return:
-    model and predicted cluster labels
+    w: the k eigen values, in the given order
+    V: n x k, the corresponding eigen vectors
     """
     assert order in {'asc', 'desc'}
-    
+    assert solver in {'eigsh', 'lobpcg'}
+    if issparse(L) or isinstance(L, np.ndarray):
+        # both solvers silently return wrong pairs otherwise
+        assert abs(L - L.T).max() <= 1e-10 * abs(L).max(), 'L must be symmetric'
+    n = L.shape[0]
+
+    if solver == 'eigsh':
+        kwargs = dict(k=k, tol=(0 if tol is None else tol), maxiter=maxiter)
+        if V0 is not None:
+            kwargs['v0'] = np.asarray(V0).sum(axis=1)
+        if shift_invert:
+            assert order == 'asc', 'shift-invert is for the smallest eigen values'
+            w, V = eigsh(L, sigma=sigma, which='LM', **kwargs)
+        else:
+            w, V = eigsh(
+                L, which={'asc': 'SA', 'desc': 'LA'}[order], **kwargs)
+    else:
+        assert not shift_invert, 'shift-invert is only for eigsh'
+        rng = check_random_state(random_state)
+        X = rng.normal(size=(n, k))
+        if V0 is not None:
+            V0 = np.asarray(V0)[:, :k]
+            X[:, :V0.shape[1]] = V0
+        w, V = lobpcg(
+            L, X, tol=tol, maxiter=(200 if maxiter is None else maxiter),
+            largest=(order == 'desc'))
+
+    indx = np.argsort(w)
+    if order == 'desc':
+        indx = indx[::-1]
+    return w[indx], V[:, indx]
+
+
+def eigenvectors(L, k, order, solver='eig', V0=None, **kwargs):
+    """
+    The k first eigen pairs of L in the given order
+
+    solver: 'eig' (full dense decomposition) or
+        'eigsh'/'lobpcg' (only the top-k, L symmetric, see `top_k_eigenvectors`)
+    V0: initial eigen vectors for the top-k solvers
+    kwargs: passed to `top_k_eigenvectors`
+
+    return:
+    w: the k eigen values
+    V: n x k, the corresponding eigen vectors
+    """
+    assert order in {'asc', 'desc'}
+    assert solver in EIGEN_SOLVERS
+
+    if solver != 'eig':
+        return top_k_eigenvectors(L, k, order, solver, V0=V0, **kwargs)
+
     w, v = np.linalg.eig(L)
-    
+
     if order == 'desc':
         indx = np.argsort(w)[::-1]
     else:
         indx = np.argsort(w)
     w = w[indx]
     v = v[:, indx]
-    X = v[:, :k]
+    return w[:k], v[:, :k]
 
-    model = KMeans(n_clusters=k)
-    pred_y = model.fit_predict(X)
-    return model, pred_y
 
+def predict_cluster_labels(L, k, order, warm_start=None, solver='eig', **kwargs):
+    """L: the laplacian matrix
+    k: the k in top-k eigen vectors
+    warm_start: dict of the previous labels 'C' and 'centroids' (see `kmeans`),
+        and eigen vectors 'V' for the top-k solvers
+    solver: 'eig' (full dense decomposition) or
+        'eigsh'/'lobpcg' (only the top-k, L symmetric, see `top_k_eigenvectors`)
+    kwargs: passed to `top_k_eigenvectors`
+
+    return:
+    model and predicted cluster labels
+    """
+    V0 = None
+    if solver != 'eig':
+        V0 = (warm_start or {}).get('V')
+        if V0 is not None and V0.shape[0] != L.shape[0]:
+            V0 = None
+    w, X = eigenvectors(L, k, order, solver, V0=V0, **kwargs)
+    if solver != 'eig' and warm_start is not None:
+        warm_start['V'] = X
+
+    return kmeans(X, k, warm_start)
+
+
+def matrix_fingerprint(M):
+    """
+    sha1 hex digest of the content of M,
+    the same for the dense and all the sparse formats of the same matrix
+    """
+    h = hashlib.sha1()
+    h.update(repr(M.shape).encode())
+    M = csr_matrix(M, dtype=np.float64, copy=True)
+    M.sum_duplicates()
+    M.eliminate_zeros()
+    for a in (M.indptr.astype(np.int64), M.indices.astype(np.int64), M.data):
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+
+def solver_settings(solver, **kwargs):
+    """
+    short sha1 hex digest of the solver and its kwargs (as passed to `eigenvectors`),
+    without the initial vectors V0, which do not change the converged eigen pairs
+    """
+    kwargs.pop('V0', None)
+    h = hashlib.sha1(repr((solver, sorted(kwargs.items()))).encode())
+    return h.hexdigest()[:12]
+
+
+def _kmeans_shard(bounds, ks, kwargs):
+    V = worker_arrays()['V']
+    return [kmeans(V[:, :k], k, **kwargs)[1] for k in ks[bounds[0]:bounds[1]]]
+
+
+class SpectralEmbedding(object):
+    """
+    The first k_max eigen vectors of a laplacian, computed once
+    and shared by the clusterings for all k <= k_max
+
+    With cache_dir, the eigen pairs are saved in
+    '<cache_dir>/<fingerprint of L>_<order>_<settings>_<k>.npz'
+    and loaded by any later embedding of the same matrix with k_max <= k
+    and the same settings (the solver and its kwargs, but V0, see `solver_settings`).
+    """
+
+    def __init__(self, L, k_max, order, solver='eigsh', cache_dir=None, **kwargs):
+        """
+        L: the laplacian matrix
+        k_max: the largest k to cluster with
+        order: 'asc' or 'desc', as in `predict_cluster_labels`
+        solver, kwargs: passed to `eigenvectors`
+        cache_dir: directory of the cached eigen pairs, or None (no disk cache)
+        """
+        assert order in {'asc', 'desc'}
+        self.k_max = k_max
+        self.order = order
+        self.fingerprint = matrix_fingerprint(L)
+        self.settings = solver_settings(solver, **kwargs)
+        self.cache_dir = cache_dir
+        self.from_cache = False
+
+        cached = self._load()
+        if cached is None:
+            self.w, self.V = eigenvectors(L, k_max, order, solver, **kwargs)
+            if np.iscomplexobj(self.V) and np.allclose(self.V.imag, 0):
+                self.w, self.V = self.w.real, self.V.real
+            self._save()
+        else:
+            self.w, self.V = cached
+            self.from_cache = True
+
+    def _cache_files(self):
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return []
+        prefix = '{}_{}_{}_'.format(self.fingerprint, self.order, self.settings)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith('.npz'):
+                k = name[len(prefix):-len('.npz')]
+                if k.isdigit():
+                    files.append((int(k), os.path.join(self.cache_dir, name)))
+        return sorted(files)
+
+    def _load(self):
+        for k, path in self._cache_files():
+            if k >= self.k_max:
+                data = np.load(path)
+                return data['w'][:self.k_max], data['V'][:, :self.k_max]
+        return None
+
+    def _save(self):
+        if self.cache_dir is None:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = os.path.join(self.cache_dir, '{}_{}_{}_{}.npz'.format(
+            self.fingerprint, self.order, self.settings, self.k_max))
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, w=self.w, V=self.V)
+        os.replace(tmp, path)
+
+    def vectors(self, k):
+        """n x k, the first k eigen vectors
+        """
+        assert k <= self.k_max
+        return self.V[:, :k]
 
-def predict_cluster_labels_sparse(L, k, order, **kwargs):
+    def predict_cluster_labels(self, k, warm_start=None, **kwargs):
+        """
+        Same as `predict_cluster_labels(L, k, order)` without the decomposition
+
+        return:
+        model and predicted cluster labels
+        """
+        return kmeans(self.vectors(k), k, warm_start, **kwargs)
+
+    def sweep(self, ks, n_jobs=1, **kwargs):
+        """
+        KMeans labels for each k in ks, on the first k eigen vectors,
+        the ks being clustered in parallel over a process pool
+
+        kwargs: passed to KMeans (e.g. random_state)
+
+        return:
+        dict of k -> predicted cluster labels
+        """
+        ks = list(ks)
+        assert max(ks) <= self.k_max
+        if n_workers(n_jobs) > 1 and len(ks) > 1:
+            shards = map_shards(partial(_kmeans_shard, ks=ks, kwargs=kwargs),
+                                {'V': self.V}, len(ks), n_jobs, n_shards=len(ks))
+            labels = [l for shard in shards for l in shard]
+        else:
+            labels = [self.predict_cluster_labels(k, **kwargs)[1] for k in ks]
+        return dict(zip(ks, labels))
+
+
+def factor_embedding(X, Y, method='eig'):
+    """
+    Top eigen (or singular) vectors of the rank-k matrix M = X Y,
+    computed in O(n k^2) time and O(n k) memory without forming M
+
+    - 'eig': M (X v) = X (Y X v), so the eigenvectors of M with nonzero eigenvalues
+      are X v for the eigenvectors v of the k x k matrix Y X (M square)
+    - 'svd': from the thin QR decompositions X = Q_x R_x and Y^T = Q_y R_y,
+      M = Q_x (R_x R_y^T) Q_y^T, so the left singular vectors of M
+      are Q_x times those of the k x k core
+
+    Args:
+
+    X: n x k
+    Y: k x m
+    method: 'eig' or 'svd'
+
+    Returns:
+    w: the k eigen/singular values, in descending order
+    V: n x k, the corresponding unit vectors
+    """
+    assert method in {'eig', 'svd'}
+    if method == 'eig':
+        assert X.shape[0] == Y.shape[1]
+        w, v = np.linalg.eig(np.dot(Y, X))
+        V = np.dot(X, v)
+        V /= np.maximum(np.linalg.norm(V, axis=0), 1e-12)
+    else:
+        Q_x, R_x = np.linalg.qr(X)
+        Q_y, R_y = np.linalg.qr(Y.T)
+        u, w, _ = np.linalg.svd(np.dot(R_x, R_y.T))
+        V = np.dot(Q_x, u)
+    indx = np.argsort(w)[::-1]
+    return w[indx], V[:, indx]
+
+
+def predict_cluster_labels_factors(X, Y, k, method='eig', warm_start=None):
+    """
+    Same as `predict_cluster_labels(np.dot(X, Y), k, order='desc')`
+    (or `predict_cluster_labels_svd` for method='svd'),
+    the embedding being computed by `factor_embedding`
+
+    X: n x k, Y: k x m, the factors of the completed matrix
+    warm_start: dict of the previous labels 'C' and 'centroids' (see `kmeans`)
+
+    return:
+    model and predicted cluster labels
+    """
+    _, V = factor_embedding(X, Y, method)
+    if np.iscomplexobj(V) and np.allclose(V.imag, 0):
+        V = V.real
+    return kmeans(V[:, :k], k, warm_start)
+
+
+def predict_cluster_labels_sparse(L, k, order, warm_start=None, **kwargs):
     """L: the laplacian matrix (sparse)
     k: the k in top-k eigen vectors
+    warm_start: dict of the previous labels 'C' and 'centroids' (see `kmeans`)
 
     return:
     model and predicted cluster labels
@@ -90,6 +444,4 @@ def predict_cluster_labels_sparse(L, k, order, **kwargs):
     u, s, vt = scipy.sparse.linalg.svds(L, k=k, which=m[order], **kwargs)
     
     X = u
-    model = KMeans(n_clusters=k)
-    pred_y = model.fit_predict(X)
-    return model, pred_y
+    return kmeans(X, k, warm_start)
@@ -2,9 +2,14 @@ import networkx as nx
 import numpy as np
 
 from tqdm import tqdm
-from scipy.sparse import isspmatrix_csr
+from functools import partial
+from scipy.sparse import isspmatrix_csr, csr_matrix
 from collections import Counter, defaultdict
 
+from ..utils.parallel import n_workers, map_shards, worker_arrays
+from ..utils.signed_graph import SignedGraph
+from ..utils.matrix import expand_rows
+
 
 def extract_nodes_and_signs(e, e1, e2):
     """
@@ -49,19 +54,34 @@ def get_sign_1st_order(e, e1, e2, C, return_type=False):
                 return -1
 
 
-def first_order_triangles_count(A, C, T):
+def first_order_triangles_count(A, C, T, method='spgemm'):
     """
     Args:
     
     A: sign matrix (sparse,csr or lil)
     C: cluster label array
     T: target edges
+    method: 'spgemm' (masked sparse products, see `first_order_triangles_count_spgemm`)
+        or 'loop' (one target at a time)
 
     Returns:
     generator of (n_i, n_j, sign, count)
         note that (n_1, n_j) \in T
     """
+    assert method in {'loop', 'spgemm'}
     assert isspmatrix_csr(A)
+    if method == 'loop':
+        return _first_order_triangles_count_loop(A, C, T)
+
+    T = list(T)
+    count_by_sign, _ = first_order_triangles_count_spgemm(A, C, T)
+    return ((ni, nj, sign, int(cs[pos]))
+            for (ni, nj), cs in zip(T, count_by_sign)
+            for pos, sign in enumerate((-1, 1))
+            if cs[pos] > 0)
+
+
+def _first_order_triangles_count_loop(A, C, T):
     A_lil = A.tolil()  # fast single element indexing
     print("greedy -> first_order_triangles_count:")
 
@@ -92,7 +112,7 @@ def first_order_triangles_count_g(g, C, T):
     """
     Args:
     
-    g: nx.Graph
+    g: nx.Graph or SignedGraph
     C: cluster label array
     T: target edges
 
@@ -100,6 +120,12 @@ def first_order_triangles_count_g(g, C, T):
     generator of (n_i, n_j, sign, count)
         note that (n_1, n_j) \in T
     """
+    if isinstance(g, SignedGraph):
+        for ni, nj, cs, _ in _signed_graph_counts(g, C, T):
+            for pos, sign in enumerate((-1, 1)):
+                if cs[pos] > 0:
+                    yield (ni, nj, sign, int(cs[pos]))
+        return
     assert isinstance(g, nx.Graph)
 
     for ni, nj in T:
@@ -121,7 +147,7 @@ def first_order_triangles_net_count_g(g, C, T):
 
     Args:
     
-    g: nx.Graph
+    g: nx.Graph or SignedGraph
     C: cluster label array
     T: target edges
 
@@ -129,6 +155,13 @@ def first_order_triangles_net_count_g(g, C, T):
     generator of (n_i, n_j, sign, net_count, count_by_sign)
         note that (n_1, n_j) \in T
     """
+    if isinstance(g, SignedGraph):
+        for ni, nj, cs, ct in _signed_graph_counts(g, C, T):
+            sign, net_count = net_count_by_sign(cs[None, :])
+            yield (ni, nj, int(sign[0]), int(net_count[0]),
+                   tuple(int(c) for c in cs),
+                   _type_info(ct))
+        return
     assert isinstance(g, nx.Graph)
 
     for ni, nj in T:
@@ -161,6 +194,326 @@ def first_order_triangles_net_count_g(g, C, T):
                tuple(count_by_sign),
                tuple(sorted(count_by_type.items(), key=lambda t: t[1], reverse=True)))
 
+
+# column order of `count_by_type`
+TRIANGLE_TYPES = ('s+1', 's-1', 'w-1')
+
+
+def cluster_label_codes(C, n):
+    """
+    C: cluster label array or dict (node -> label)
+    n: number of nodes
+
+    Returns:
+    int array of length n, nodes in the same cluster share the same code
+    """
+    if isinstance(C, dict):
+        C = [C[i] for i in range(n)]
+    return np.unique(np.asarray(C), return_inverse=True)[1].ravel()
+
+
+def _target_array(T):
+    """list/set of (i, j) -> int array of shape (m, 2)
+    """
+    if not isinstance(T, np.ndarray):
+        T = list(T)
+    return np.asarray(T, dtype=np.int64).reshape(-1, 2)
+
+
+def _chunks(work, chunk_size):
+    """split range(len(work)) into consecutive (start, end) slices
+    whose work sums up to roughly chunk_size
+    """
+    cum = np.cumsum(work)
+    start = 0
+    while start < len(work):
+        base = cum[start - 1] if start > 0 else 0
+        end = max(int(np.searchsorted(cum, base + chunk_size, side='right')),
+                  start + 1)
+        yield start, end
+        start = end
+
+
+def _entry_keys(A):
+    """row * n + col of every stored entry,
+    sorted if A has sorted indices
+    """
+    n = A.shape[1]
+    rows = np.repeat(np.arange(A.shape[0], dtype=np.int64), np.diff(A.indptr))
+    return rows * n + A.indices
+
+
+def _common_neighbors(A, T, chunk_size):
+    """
+    Third nodes of the targets by intersecting sorted neighbor arrays:
+    the neighbors of the lower degree end are searched (binary search on the CSR entries)
+    in the row of the other end
+
+    A: csr matrix with sorted indices
+    T: int array (m, 2)
+
+    Returns:
+    generator of (start, end, owner, ni, nj, nk, pos_ik, pos_jk), one per chunk of targets T[start:end]
+
+    owner: index of the target in the chunk, one per triangle
+    ni, nj, nk: nodes of the triangle, (ni, nj) being the target
+    pos_ik, pos_jk: positions of (ni, nk) and (nj, nk) in A.indices and A.data
+    """
+    if A.nnz == 0:
+        return
+    n = A.shape[1]
+    keys = _entry_keys(A)
+    degrees = np.diff(A.indptr)
+
+    swap = degrees[T[:, 0]] > degrees[T[:, 1]]
+    src = np.where(swap, T[:, 1], T[:, 0])
+    dst = np.where(swap, T[:, 0], T[:, 1])
+
+    for start, end in _chunks(degrees[src], chunk_size):
+        owner, pos_ik = expand_rows(A.indptr, src[start:end])
+        ni, nj = src[start:end][owner], dst[start:end][owner]
+        nk = A.indices[pos_ik]
+
+        query = nj * n + nk
+        pos_jk = np.searchsorted(keys, query)
+        pos_jk[pos_jk == len(keys)] = 0
+        valid = (keys[pos_jk] == query) & (nk != ni) & (nk != nj)
+        yield (start, end, owner[valid], ni[valid], nj[valid], nk[valid],
+               pos_ik[valid], pos_jk[valid])
+
+
+def _count_shard(bounds, chunk_size):
+    arrays = worker_arrays()
+    n = arrays['indptr'].shape[0] - 1
+    A = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                   shape=(n, n), copy=False)
+    start, end = bounds
+    return first_order_triangles_count_csr(A, arrays['labels'],
+                                           arrays['T'][start:end],
+                                           chunk_size=chunk_size)
+
+
+def _triangle_types(s_ik, s_jk, ci, cj, ck):
+    """
+    Balance type of triangles given the signs of their two known edges
+    and the clusters of their nodes (arrays, one entry per triangle)
+
+    Returns:
+    bool arrays weak (w-1), strong_pos (s+1), strong_neg (s-1)
+    """
+    valid = (s_ik != 0) & (s_jk != 0)
+    weak = (valid & (s_ik < 0) & (s_jk < 0)
+            & (ci != cj) & (ci != ck) & (cj != ck))
+    strong_pos = valid & ~weak & (s_ik * s_jk > 0)
+    strong_neg = valid & ~weak & (s_ik * s_jk < 0)
+    return weak, strong_pos, strong_neg
+
+
+def _signed_graph_counts(g, C, T):
+    """
+    Per target triangle counts on a SignedGraph,
+    intersecting the sorted neighbor arrays of both ends
+
+    Returns:
+    generator of (n_i, n_j, count_by_sign, count_by_type),
+        counts as in `first_order_triangles_count_csr`
+    """
+    if isinstance(C, dict):
+        labels = cluster_label_codes(C, g.number_of_nodes())
+    else:
+        labels = np.asarray(C)
+    for ni, nj in T:
+        nk = np.intersect1d(g.neighbors(ni), g.neighbors(nj), assume_unique=True)
+        nk = nk[(nk != ni) & (nk != nj)]
+        weak, strong_pos, strong_neg = _triangle_types(
+            g.signs(ni, nk), g.signs(nj, nk), labels[ni], labels[nj], labels[nk])
+        n_weak, n_pos, n_neg = (np.count_nonzero(weak),
+                                np.count_nonzero(strong_pos),
+                                np.count_nonzero(strong_neg))
+        yield (ni, nj,
+               np.array([n_neg + n_weak, n_pos]),
+               np.array([n_pos, n_neg, n_weak]))
+
+
+def first_order_triangles_count_csr(A, C, T, chunk_size=2**20, n_jobs=1):
+    """
+    Vectorized version of `first_order_triangles_net_count_g`
+    that counts the triangles of all targets at once
+    (see `_common_neighbors`)
+
+    Args:
+
+    A: sign matrix (csr, symmetric), for example `g2csr(g)`
+    C: cluster label array (or dict)
+    T: target edges, list of (n_i, n_j) or array of shape (m, 2)
+    chunk_size: max number of candidate third nodes examined at once (bounds memory)
+    n_jobs: number of processes, the targets being sharded across them (-1 for all cores)
+
+    Returns:
+    count_by_sign: int array (m, 2), column 0 for -1, column 1 for 1
+    count_by_type: int array (m, 3), columns in the order of TRIANGLE_TYPES
+    """
+    assert isspmatrix_csr(A)
+    if not A.has_sorted_indices:
+        A = A.sorted_indices()
+    n = A.shape[0]
+    labels = cluster_label_codes(C, n)
+    T = _target_array(T)
+
+    m = T.shape[0]
+    if n_workers(n_jobs) > 1 and m > 0:
+        counts = map_shards(partial(_count_shard, chunk_size=chunk_size),
+                            {'indptr': A.indptr, 'indices': A.indices,
+                             'data': A.data, 'labels': labels, 'T': T},
+                            m, n_jobs)
+        return (np.concatenate([c[0] for c in counts]),
+                np.concatenate([c[1] for c in counts]))
+
+    count_by_sign = np.zeros((m, 2), dtype=np.int64)
+    count_by_type = np.zeros((m, len(TRIANGLE_TYPES)), dtype=np.int64)
+    for start, end, owner, ni, nj, nk, pos_ik, pos_jk in _common_neighbors(
+            A, T, chunk_size):
+        weak, strong_pos, strong_neg = _triangle_types(
+            A.data[pos_ik], A.data[pos_jk], labels[ni], labels[nj], labels[nk])
+
+        size = end - start
+        n_weak = np.bincount(owner[weak], minlength=size)
+        n_pos = np.bincount(owner[strong_pos], minlength=size)
+        n_neg = np.bincount(owner[strong_neg], minlength=size)
+
+        count_by_sign[start:end, 0] = n_neg + n_weak
+        count_by_sign[start:end, 1] = n_pos
+        count_by_type[start:end, 0] = n_pos
+        count_by_type[start:end, 1] = n_neg
+        count_by_type[start:end, 2] = n_weak
+    return count_by_sign, count_by_type
+
+
+def _masked_product(X, Y, rows, cols):
+    """entries (rows[t], cols[t]) of X Y^T,
+    computed on the target pattern only (Hadamard product of the gathered rows)
+    """
+    return np.asarray(X[rows].multiply(Y[cols]).sum(axis=1)).ravel()
+
+
+def first_order_triangles_count_spgemm(A, C, T, chunk_size=2**16):
+    """
+    Masked sparse matrix product version of `first_order_triangles_count_csr`
+
+    Let A+, A- be the positive/negative indicator matrices (without the diagonal).
+    For target (i, j), the triangle votes are the (i, j) entries of
+
+    - A+ A+^T: both signs positive (s+1)
+    - A+ A-^T + A- A+^T: mixed signs (s-1)
+    - A- A-^T: both signs negative,
+      which are weak (w-1) if i, j and k are in three different clusters and s+1 otherwise
+
+    The weak votes of targets across clusters are
+    (A- A-^T - (A- o PP^T) A-^T - A- (A- o PP^T)^T)[i, j],
+    P being the cluster indicator matrix, i.e. remove the k in the cluster of i or of j.
+
+    Args:
+
+    A: sign matrix (csr)
+    C: cluster label array (or dict)
+    T: target edges, list of (n_i, n_j) or array of shape (m, 2)
+    chunk_size: number of targets per product
+
+    Returns:
+    count_by_sign: int array (m, 2), column 0 for -1, column 1 for 1
+    count_by_type: int array (m, 3), columns in the order of TRIANGLE_TYPES
+    """
+    assert isspmatrix_csr(A)
+    n = A.shape[0]
+    labels = cluster_label_codes(C, n)
+    T = _target_array(T)
+
+    A = A.tocoo()
+    offdiag = (A.row != A.col)
+    rows, cols, data = A.row[offdiag], A.col[offdiag], A.data[offdiag]
+    same_cluster = (labels[rows] == labels[cols])
+
+    def indicator(mask):
+        return csr_matrix((np.ones(np.count_nonzero(mask), dtype=np.int64),
+                           (rows[mask], cols[mask])),
+                          shape=A.shape)
+
+    A_p = indicator(data > 0)
+    A_n = indicator(data < 0)
+    A_n_same = indicator((data < 0) & same_cluster)
+
+    m = T.shape[0]
+    count_by_sign = np.zeros((m, 2), dtype=np.int64)
+    count_by_type = np.zeros((m, len(TRIANGLE_TYPES)), dtype=np.int64)
+    for start in range(0, m, chunk_size):
+        ti = T[start:start + chunk_size, 0]
+        tj = T[start:start + chunk_size, 1]
+
+        pp = _masked_product(A_p, A_p, ti, tj)
+        nn = _masked_product(A_n, A_n, ti, tj)
+        pn = (_masked_product(A_p, A_n, ti, tj)
+              + _masked_product(A_n, A_p, ti, tj))
+        weak = (nn
+                - _masked_product(A_n_same, A_n, ti, tj)
+                - _masked_product(A_n, A_n_same, ti, tj))
+        weak[labels[ti] == labels[tj]] = 0
+
+        count_by_sign[start:start + chunk_size, 0] = pn + weak
+        count_by_sign[start:start + chunk_size, 1] = pp + nn - weak
+        count_by_type[start:start + chunk_size, 0] = pp + nn - weak
+        count_by_type[start:start + chunk_size, 1] = pn
+        count_by_type[start:start + chunk_size, 2] = weak
+    return count_by_sign, count_by_type
+
+
+def net_count_by_sign(count_by_sign):
+    """
+    count_by_sign: int array (m, 2), column 0 for -1, column 1 for 1
+
+    Returns:
+    signs: the sign with more votes (-1 on ties, as in `first_order_triangles_net_count_g`)
+    net_counts: #balanced - #imbalanced
+    """
+    signs = np.where(count_by_sign[:, 1] > count_by_sign[:, 0], 1, -1)
+    net_counts = np.abs(count_by_sign[:, 0] - count_by_sign[:, 1])
+    return signs, net_counts
+
+
+def _type_info(type_counts):
+    return tuple(sorted(((t, int(c))
+                         for t, c in zip(TRIANGLE_TYPES, type_counts)
+                         if c > 0),
+                        key=lambda t: t[1], reverse=True))
+
+
+def first_order_triangles_net_count_csr(A, C, T, **kwargs):
+    """
+    Same as `first_order_triangles_net_count_g`
+    but computed by `first_order_triangles_count_csr`
+
+    Args:
+    
+    A: sign matrix (csr, symmetric)
+    C: cluster label array
+    T: target edges
+    kwargs: passed to `first_order_triangles_count_csr`
+
+    Returns:
+    generator of (n_i, n_j, sign, net_count, count_by_sign, count_by_type)
+    """
+    T = list(T)
+    count_by_sign, count_by_type = first_order_triangles_count_csr(A, C, T, **kwargs)
+    return _net_count_tuples(T, count_by_sign, count_by_type)
+
+
+def _net_count_tuples(T, count_by_sign, count_by_type):
+    signs, net_counts = net_count_by_sign(count_by_sign)
+    for (ni, nj), s, nc, cs, ct in zip(T, signs, net_counts,
+                                       count_by_sign, count_by_type):
+        yield (ni, nj, int(s), int(nc),
+               tuple(int(c) for c in cs),
+               _type_info(ct))
+
             
 def build_edge2edges(g, T):
     """
@@ -187,3 +540,289 @@ def build_edge2edges(g, T):
             if e2 in T:
                 e2es[e].add(e2)
     return e2es
+
+
+class EdgeIndex(object):
+    """
+    Sorted edges numbered by int32 edge ids, with vectorized edge -> id lookup
+    """
+
+    def __init__(self, edges, n_nodes):
+        """
+        edges: int array (m, 2), sorted, edge id -> (i, j)
+        n_nodes: number of nodes
+        """
+        self.edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        self.n_nodes = int(n_nodes)
+        self.keys = (self.edges[:, 0].astype(np.int64) * self.n_nodes
+                     + self.edges[:, 1])
+
+    def __len__(self):
+        return self.edges.shape[0]
+
+    def __iter__(self):
+        return (tuple(e) for e in self.edges.tolist())
+
+    def __contains__(self, e):
+        return self.edge_ids([e])[0] >= 0
+
+    def edge_ids(self, edges):
+        """
+        edges: list of (i, j) or int array (m, 2)
+
+        Returns:
+        the edge ids, -1 for the unknown edges
+        """
+        edges = _target_array(edges)
+        if len(self.keys) == 0:
+            return -np.ones(edges.shape[0], dtype=np.int64)
+        keys = edges[:, 0] * self.n_nodes + edges[:, 1]
+        ids = np.searchsorted(self.keys, keys)
+        ids[ids == len(self.keys)] = 0
+        return np.where(self.keys[ids] == keys, ids, -1)
+
+
+def _sorted_edges(T):
+    T = _target_array(T)
+    return T[np.lexsort((T[:, 1], T[:, 0]))]
+
+
+class Edge2Edges(EdgeIndex):
+    """
+    Compact version of the `build_edge2edges` output
+
+    The targets are sorted and numbered by int32 edge ids,
+    the edge ids in some triangle with edge `eid` being
+    `indices[indptr[eid]:indptr[eid+1]]`.
+
+    Can be used in place of the dict: `e2es[(i, j)]` gives the list of edges.
+    """
+
+    def __init__(self, edges, indptr, indices, n_nodes):
+        """
+        edges: int array (m, 2), sorted, edge id -> (i, j)
+        indptr, indices: the CSR of edge id -> edge ids
+        n_nodes: number of nodes
+        """
+        super(Edge2Edges, self).__init__(edges, n_nodes)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    def neighbors(self, eid):
+        """edge ids that are in some triangle with edge `eid`
+        """
+        return self.indices[self.indptr[eid]:self.indptr[eid + 1]]
+
+    def __getitem__(self, e):
+        eid = self.edge_ids([e])[0]
+        if eid < 0:
+            return []
+        return [tuple(x) for x in self.edges[self.neighbors(eid)].tolist()]
+
+    def save(self, path):
+        np.savez(path,
+                 edges=self.edges,
+                 indptr=self.indptr,
+                 indices=self.indices,
+                 n_nodes=self.n_nodes)
+
+    @classmethod
+    def load(cls, path):
+        loader = np.load(path)
+        return cls(loader['edges'], loader['indptr'], loader['indices'],
+                   loader['n_nodes'])
+
+
+def _edge2edges_pairs(S, T, start, end, chunk_size):
+    """
+    (edge id, edge id) pairs in some triangle, for the targets T[start:end]
+
+    S: adjacency (csr, sorted indices) including the target edges
+    T: all the targets (sorted int array), the edge ids being their positions
+    """
+    e2es = EdgeIndex(T, S.shape[0])
+
+    srcs, dsts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for offset, _, owner, ni, nj, nk, _, _ in _common_neighbors(
+            S, T[start:end], chunk_size):
+        eid = start + offset + owner
+        for na in (ni, nj):
+            e = np.stack([np.minimum(na, nk), np.maximum(na, nk)], axis=1)
+            other = e2es.edge_ids(e)
+            srcs.append(eid[other >= 0])
+            dsts.append(other[other >= 0])
+    return np.concatenate(srcs), np.concatenate(dsts)
+
+
+def _edge2edges_shard(bounds, chunk_size):
+    arrays = worker_arrays()
+    n = arrays['S_indptr'].shape[0] - 1
+    S = csr_matrix((arrays['S_data'], arrays['S_indices'], arrays['S_indptr']),
+                   shape=(n, n), copy=False)
+    return _edge2edges_pairs(S, arrays['T'], bounds[0], bounds[1], chunk_size)
+
+
+def build_edge2edges_csr(A, T, chunk_size=2**20, n_jobs=1):
+    """
+    Same relation as `build_edge2edges`, built by vectorized neighbor intersection
+
+    A: sign matrix (csr), only its pattern is used
+    T: target edges
+    chunk_size: max number of candidate third nodes examined at once (bounds memory)
+    n_jobs: number of processes, the targets being sharded across them (-1 for all cores)
+
+    Returns:
+    Edge2Edges
+    """
+    assert isspmatrix_csr(A)
+    n = A.shape[0]
+    T = _sorted_edges(T)
+    m = T.shape[0]
+
+    # the graph with the target edges added
+    A = A.tocoo()
+    rows = np.concatenate([A.row, T[:, 0], T[:, 1]])
+    cols = np.concatenate([A.col, T[:, 1], T[:, 0]])
+    S = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                   shape=(n, n))
+    S.sort_indices()
+
+    if n_workers(n_jobs) > 1 and m > 0:
+        pairs = map_shards(partial(_edge2edges_shard, chunk_size=chunk_size),
+                           {'S_indptr': S.indptr, 'S_indices': S.indices,
+                            'S_data': S.data, 'T': T},
+                           m, n_jobs)
+        src = np.concatenate([p[0] for p in pairs])
+        dst = np.concatenate([p[1] for p in pairs])
+    else:
+        src, dst = _edge2edges_pairs(S, T, 0, m, chunk_size)
+
+    order = np.lexsort((dst, src))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=m))])
+    return Edge2Edges(T, indptr, dst[order], n)
+
+
+def changed_nodes(C_old, C_new):
+    """
+    Nodes whose cluster membership changed, regardless of how the clusters are numbered
+
+    Each new cluster is matched to at most one old cluster (greedily, by overlap size),
+    so that for any two unchanged nodes, being in the same cluster stays the same.
+
+    Returns:
+    bool array, True for the changed nodes
+    """
+    C_old, C_new = np.asarray(C_old), np.asarray(C_new)
+    base = C_old.max() + 1
+    pairs, overlaps = np.unique(C_new.astype(np.int64) * base + C_old,
+                                return_counts=True)
+
+    mapping = {}
+    used = set()
+    for pair in pairs[np.argsort(-overlaps, kind='mergesort')]:
+        c_new, c_old = divmod(int(pair), int(base))
+        if c_new not in mapping and c_old not in used:
+            mapping[c_new] = c_old
+            used.add(c_old)
+
+    # unmatched new clusters get unused labels
+    matched = np.array([mapping.get(c, base + c) for c in range(C_new.max() + 1)])
+    return matched[C_new] != C_old
+
+
+class TriangleCountCache(object):
+    """
+    Triangle counts of the targets kept across iterations of `iterative_approach`
+    (pass it to `faster_greedy` through `solve_maxbalance_kwargs`)
+
+    `update` compares the new graph and partition to the previous ones
+    and marks as stale only the targets whose triangles may have changed:
+
+    - targets incident to a node with added/changed edges
+    - targets incident to a node whose cluster changed
+    - targets having such a node as third node
+
+    Stale targets are recounted when they are looked up.
+    """
+
+    def __init__(self, T, n_jobs=1):
+        """
+        T: all the target edges
+        n_jobs: number of processes for recounting
+        """
+        self.edges = _sorted_edges(T)
+        self.n_jobs = n_jobs
+        self.index = None  # built on the first update, when the node number is known
+        self.A = None
+        self.labels = None
+        self.stale = np.ones(len(self.edges), dtype=bool)
+        self.count_by_sign = np.zeros((len(self.edges), 2), dtype=np.int64)
+        self.count_by_type = np.zeros((len(self.edges), len(TRIANGLE_TYPES)),
+                                      dtype=np.int64)
+        self.n_recounted = 0  # accumulated
+
+    def update(self, A, C):
+        """
+        A: the current sign matrix (csr)
+        C: the current cluster label array (or dict)
+        """
+        assert isspmatrix_csr(A)
+        if not A.has_sorted_indices:
+            A = A.sorted_indices()
+        n = A.shape[0]
+        labels = cluster_label_codes(C, n)
+
+        if self.A is None:
+            self.index = EdgeIndex(self.edges, n)
+        else:
+            assert self.A.shape == A.shape
+            T = self.edges
+            rows, cols = (A - self.A).nonzero()
+            node_changed = np.zeros(n, dtype=bool)
+            node_changed[rows] = True
+            node_changed[cols] = True
+
+            label_changed = changed_nodes(self.labels, labels)
+            node_changed |= label_changed
+
+            stale = node_changed[T[:, 0]] | node_changed[T[:, 1]]
+
+            # a changed node as third node
+            Z = abs(A)[:, np.nonzero(label_changed)[0]]
+            rest = np.nonzero(~stale)[0]
+            if Z.nnz > 0 and len(rest) > 0:
+                stale[rest] = _masked_product(Z, Z, T[rest, 0], T[rest, 1]) > 0
+            self.stale |= stale
+
+        self.A = A
+        self.labels = labels
+
+    def counts(self, T):
+        """
+        T: target edges (in the T given at construction)
+
+        Returns:
+        count_by_sign, count_by_type (see `first_order_triangles_count_csr`)
+        """
+        assert self.A is not None, 'call update first'
+        ids = self.index.edge_ids(T)
+        assert (ids >= 0).all(), 'unknown targets'
+
+        to_count = np.unique(ids[self.stale[ids]])
+        if len(to_count) > 0:
+            count_by_sign, count_by_type = first_order_triangles_count_csr(
+                self.A, self.labels, self.edges[to_count],
+                n_jobs=self.n_jobs)
+            self.count_by_sign[to_count] = count_by_sign
+            self.count_by_type[to_count] = count_by_type
+            self.stale[to_count] = False
+            self.n_recounted += len(to_count)
+        return self.count_by_sign[ids], self.count_by_type[ids]
+
+    def net_count(self, T):
+        """
+        Same output as `first_order_triangles_net_count_csr`
+        """
+        T = list(T)
+        count_by_sign, count_by_type = self.counts(T)
+        return _net_count_tuples(T, count_by_sign, count_by_type)
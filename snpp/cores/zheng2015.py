@@ -3,7 +3,9 @@
 
 
 import numpy as np
-from .spectral import build_laplacian_related_matrices
+from .spectral import build_laplacian_related_matrices, \
+    build_laplacian_related_matrices_sparse, \
+    inverse_degree
 
 
 def build_L_sns(W):
@@ -20,3 +22,35 @@ def build_L_bns(W):
     """
     W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices(W)
     return np.linalg.inv(D_hat) @ (D_p - W_p + W_n)
+
+
+def _normalize_sparse(L, D_hat, symmetric):
+    if symmetric:
+        d = inverse_degree(D_hat).sqrt()
+        return (d @ L @ d).tocsr()
+    return (inverse_degree(D_hat) @ L).tocsr()
+
+
+def build_L_sns_sparse(W, symmetric=True):
+    """
+    simple normalzied signed laplacian matrix, in csr
+
+    W: the sign matrix (sparse)
+    symmetric: D^-1/2 L D^-1/2, which has the eigen values of D^-1 L (`build_L_sns`)
+        and can go to the symmetric solvers (`spectral.top_k_eigenvectors`),
+        its eigen vectors u giving those of D^-1 L as D^-1/2 u;
+        else D^-1 L itself (not symmetric)
+    """
+    W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices_sparse(W)
+    return _normalize_sparse((D_p - W_p) - (D_n - W_n), D_hat, symmetric)
+
+
+def build_L_bns_sparse(W, symmetric=True):
+    """
+    balanced normalzied signed laplacian matrix, in csr
+
+    W: the sign matrix (sparse)
+    symmetric: D^-1/2 L D^-1/2 or D^-1 L (`build_L_bns`), see `build_L_sns_sparse`
+    """
+    W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices_sparse(W)
+    return _normalize_sparse(D_p - W_p + W_n, D_hat, symmetric)
@@ -16,6 +16,21 @@ def indexed_entries(sparse_matrix):
             for i, j in zip(*sparse_matrix.nonzero()))
 
 
+def expand_rows(indptr, rows):
+    """
+    The stored entries of some rows of a csr matrix
+
+    Returns:
+    owner: for each stored entry in `rows`, its position in `rows`
+    pos: for each stored entry in `rows`, its position in `indices`/`data`
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    owner = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + offsets
+
+
 def zero(m):
     """return the zero-valued entries' indices
     """
@@ -57,6 +72,14 @@ def load_sparse_csr(filename):
                       shape=loader['shape'])
 
 
+def save_edges(filename, m):
+    """save the nonzero entries of m as an int array of (row_id, col_id, value) rows (.npy),
+    to be memory-mapped with `np.load(filename, mmap_mode='r')`
+    """
+    m = m.tocoo()
+    np.save(filename, np.stack([m.row, m.col, m.data], axis=1).astype(np.int64))
+
+
 def _make_matrix(items, shape):
     idx1, idx2, data = zip(*items)
     return csr_matrix((data, (idx1, idx2)), shape=shape)
@@ -0,0 +1,132 @@
+"""
+Process pool over numpy arrays placed once in shared memory
+"""
+import numpy as np
+import multiprocessing as mp
+from multiprocessing.sharedctypes import RawArray
+
+
+_worker_arrays = {}
+
+
+def n_workers(n_jobs):
+    """
+    n_jobs: number of processes, negative values count from the number of cores
+        (-1 means all cores, as in sklearn)
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(mp.cpu_count() + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def share_array(a):
+    """copy a into shared memory
+
+    Returns:
+    (RawArray, dtype string, shape), to be passed to `attach_array`
+    """
+    a = np.ascontiguousarray(a)
+    raw = RawArray('b', max(a.nbytes, 1))
+    attach_array((raw, a.dtype.str, a.shape))[...] = a
+    return raw, a.dtype.str, a.shape
+
+
+def attach_array(shared):
+    """numpy view (no copy) of an array created by `share_array`
+    """
+    raw, dtype, shape = shared
+    size = int(np.prod(shape))
+    return np.frombuffer(raw, dtype=np.dtype(dtype), count=size).reshape(shape)
+
+
+def _init_worker(shared):
+    _worker_arrays.clear()
+    for name, s in shared.items():
+        _worker_arrays[name] = attach_array(s)
+
+
+def worker_arrays():
+    """the shared arrays (dict of name -> np.ndarray) inside a worker of `map_shards`
+    """
+    return _worker_arrays
+
+
+def shard_bounds(n_items, n_shards):
+    """split range(n_items) into at most n_shards (start, end) of about the same size
+    """
+    bounds = np.linspace(0, n_items, n_shards + 1).astype(int)
+    return [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+
+def map_shards(func, arrays, n_items, n_jobs, n_shards=None):
+    """
+    Run func((start, end)) on the shards of range(n_items) in a process pool
+
+    The arrays are copied into shared memory once, before the pool starts,
+    and func gets them through `worker_arrays()`.
+    func must be picklable (module level function or functools.partial of one).
+
+    Args:
+
+    func: function of (start, end)
+    arrays: dict of name -> np.ndarray
+    n_items: number of items to shard
+    n_jobs: number of processes (see `n_workers`)
+    n_shards: number of shards (default to 4 shards per process)
+
+    Returns:
+    list of func results, in the order of the shards
+    """
+    n_procs = n_workers(n_jobs)
+    if n_shards is None:
+        n_shards = 4 * n_procs
+    shards = shard_bounds(n_items, n_shards)
+
+    shared = {name: share_array(a) for name, a in arrays.items()}
+    pool = mp.Pool(n_procs, initializer=_init_worker, initargs=(shared, ))
+    try:
+        return pool.map(func, shards)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class SharedArrayPool(object):
+    """
+    Process pool whose workers see numpy arrays placed once in shared memory
+
+    Unlike `map_shards`, the pool and the arrays are kept across the calls to `map`,
+    and the parent can update the arrays in place (through `arrays`) between them.
+
+    Usage:
+    with SharedArrayPool({'x': x}, n_jobs) as pool:
+        pool.arrays['x'][...] = new_x
+        results = pool.map(func, items)  # func gets the arrays through `worker_arrays()`
+    """
+
+    def __init__(self, arrays, n_jobs):
+        """
+        arrays: dict of name -> np.ndarray (copied)
+        n_jobs: number of processes (see `n_workers`)
+        """
+        shared = {name: share_array(a) for name, a in arrays.items()}
+        self.arrays = {name: attach_array(s) for name, s in shared.items()}
+        self.pool = mp.Pool(n_workers(n_jobs), initializer=_init_worker,
+                            initargs=(shared, ))
+
+    def map(self, func, items):
+        """func must be picklable, as for `map_shards`
+        """
+        return self.pool.map(func, items)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
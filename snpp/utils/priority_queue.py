@@ -0,0 +1,84 @@
+import heapq
+from collections import defaultdict
+
+
+class BucketQueue(object):
+    """
+    Indexed max-priority queue for non-negative integer keys (e.g. triangle counts)
+
+    Items are kept in one bucket per key.
+    Items with the same key are popped in ascending order of their rank,
+    which defaults to the insertion order.
+
+    Key updates are lazy: the item is pushed again into its new bucket
+    and the outdated entry is dropped when it reaches the top.
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(list)  # key -> heap of (rank, item)
+        self.key = {}  # item -> current key
+        self.rank = {}  # item -> rank
+        self.max_key = -1
+        self.n_pushed = 0
+
+    def __len__(self):
+        return len(self.key)
+
+    def __contains__(self, item):
+        return item in self.key
+
+    def push(self, item, key, rank=None):
+        """insert item or change its key (increase or decrease)
+
+        rank: tie-breaking order, only used when the item is new
+        """
+        assert key >= 0
+        if item not in self.rank:
+            self.rank[item] = (self.n_pushed if rank is None else rank)
+        self.n_pushed += 1
+
+        if self.key.get(item) == key:
+            return
+        self.key[item] = key
+        heapq.heappush(self.buckets[key], (self.rank[item], item))
+        if key > self.max_key:
+            self.max_key = key
+
+    def remove(self, item):
+        del self.key[item]
+        del self.rank[item]
+
+    def _top(self):
+        """drop outdated entries and return the top (rank, item) or None
+        """
+        while self.max_key >= 0:
+            bucket = self.buckets.get(self.max_key)
+            while bucket:
+                rank, item = bucket[0]
+                if (self.key.get(item) == self.max_key
+                    and self.rank[item] == rank):
+                    return bucket[0]
+                heapq.heappop(bucket)
+            self.buckets.pop(self.max_key, None)
+            self.max_key -= 1
+        return None
+
+    def peek(self):
+        """
+        Returns:
+        (item, key) with the max key (min rank among ties)
+        """
+        top = self._top()
+        if top is None:
+            raise IndexError('peek from an empty queue')
+        return top[1], self.max_key
+
+    def pop(self):
+        """
+        Returns:
+        (item, key) with the max key (min rank among ties)
+        """
+        item, key = self.peek()
+        heapq.heappop(self.buckets[key])
+        self.remove(item)
+        return item, key
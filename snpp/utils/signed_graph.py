@@ -1,6 +1,8 @@
+import numpy as np
 import networkx as nx
 from tqdm import tqdm
-from scipy.sparse import issparse, csr_matrix
+from collections import defaultdict
+from scipy.sparse import issparse, csr_matrix, diags
 from snpp.utils.matrix import indexed_entries
 
 
@@ -21,11 +23,11 @@ def make_symmetric(m):
 def fill_diagonal(m, val=1):
     assert issparse(m)
     assert m.shape[0] == m.shape[1]
-    m_new = m.todok()
-
-    for i in tqdm(range(m_new.shape[0])):
-        m_new[i, i] = val
-    return m_new.tocsr()
+    m = m.tocsr()
+    m_new = m + diags(val - m.diagonal(), 0, format='csr')
+    m_new.eliminate_zeros()
+    m_new.sort_indices()
+    return m_new
 
 
 def symmetric_stat(m):
@@ -78,6 +80,8 @@ def matrix2graph(A, W=None, nodes=None, multigraph=True):
 
 
 def to_multigraph(graph):
+    if isinstance(graph, SignedGraph):
+        return graph.to_multigraph()
     new_g = nx.MultiGraph()
     new_g.add_nodes_from(graph.nodes_iter())
     for i, j in graph.edges_iter():
@@ -89,6 +93,184 @@ def to_multigraph(graph):
 
 
 def g2m(g):
+    if isinstance(g, SignedGraph):
+        return fill_diagonal(g.csr())
     m = nx.to_scipy_sparse_matrix(g, weight='sign', format='csr')
     return fill_diagonal(m)
+
+
+def g2csr(g, n=None):
+    """sign matrix of g, row/column i being node i
+
+    column indices are sorted within each row,
+    so that the neighbors of node i are `m.indices[m.indptr[i]:m.indptr[i+1]]`
+
+    n: number of nodes (default to g.number_of_nodes())
+    """
+    if isinstance(g, SignedGraph):
+        return g.csr()
+    if n is None:
+        n = g.number_of_nodes()
+    m = nx.to_scipy_sparse_matrix(g, nodelist=list(range(n)),
+                                  weight='sign', format='csr')
+    m.sort_indices()
+    return m
     
+
+
+class SignedGraph(object):
+    """
+    Undirected signed graph over nodes 0..n-1, stored as a symmetric CSR sign matrix
+    plus an append-only buffer of the edges added since the last compaction
+
+    Edges are unweighted (weight 1), the sign of a missing edge is 0.
+    The buffer is merged into the CSR arrays every `compact_size` added edges
+    or when a CSR snapshot is asked for (`csr`).
+    Snapshots share the arrays, which are never modified in place.
+    """
+
+    def __init__(self, A=None, n=None, compact_size=2**16):
+        """
+        A: sign matrix (sparse, symmetric), or None for an empty graph of n nodes
+        n: number of nodes, when A is None
+        compact_size: number of buffered edges that triggers compaction
+        """
+        if A is None:
+            A = csr_matrix((n, n), dtype=np.float64)
+        assert issparse(A)
+        assert A.shape[0] == A.shape[1]
+        A = csr_matrix(A, dtype=np.float64)
+        A.eliminate_zeros()
+        A.sort_indices()
+        self._A = A
+        self.compact_size = compact_size
+        self._delta = defaultdict(dict)  # node -> {neighbor: sign}, both directions
+        self._n_delta = 0
+
+    @classmethod
+    def from_graph(cls, g, **kwargs):
+        """from nx.Graph with 'sign' edge attribute, nodes being 0..n-1
+        """
+        return cls(g2csr(g), **kwargs)
+
+    def copy(self):
+        new_g = SignedGraph(compact_size=self.compact_size, n=0)
+        new_g._A = self._A
+        new_g._delta = defaultdict(dict, {i: d.copy() for i, d in self._delta.items()})
+        new_g._n_delta = self._n_delta
+        return new_g
+
+    def number_of_nodes(self):
+        return self._A.shape[0]
+
+    def nodes(self):
+        return list(range(self.number_of_nodes()))
+
+    def number_of_edges(self):
+        """
+        (self loops count once)
+        """
+        A = self.csr()
+        n_loops = np.count_nonzero(A.diagonal())
+        return (A.nnz - n_loops) // 2 + n_loops
+
+    def add_edge(self, i, j, sign, weight=1):
+        """add edge or overwrite its sign
+        """
+        assert weight == 1, 'SignedGraph is unweighted'
+        assert sign != 0
+        self._delta[i][j] = sign
+        self._delta[j][i] = sign
+        self._n_delta += 1
+        if self._n_delta >= self.compact_size:
+            self.compact()
+
+    def add_edges_from(self, edges):
+        """
+        edges: iterable of (i, j, sign) or (i, j, {'sign': sign, ...}) as in networkx
+        """
+        for i, j, d in edges:
+            if isinstance(d, dict):
+                self.add_edge(i, j, **d)
+            else:
+                self.add_edge(i, j, d)
+
+    def compact(self):
+        """merge the buffered edges into the CSR arrays (new arrays)
+        """
+        if self._n_delta == 0:
+            return
+        rows, cols, data = [], [], []
+        for i, d in self._delta.items():
+            rows.extend([i] * len(d))
+            cols.extend(d.keys())
+            data.extend(d.values())
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        n = self.number_of_nodes()
+
+        # buffered signs take precedence
+        A = self._A.tocoo()
+        base_keys = A.row.astype(np.int64) * n + A.col
+        keep = ~np.in1d(base_keys, rows * n + cols)
+        A = csr_matrix((np.concatenate([A.data[keep], data]),
+                        (np.concatenate([A.row[keep], rows]),
+                         np.concatenate([A.col[keep], cols]))),
+                       shape=(n, n))
+        A.sort_indices()
+        self._A = A
+        self._delta = defaultdict(dict)
+        self._n_delta = 0
+
+    def csr(self):
+        """the sign matrix (csr, sorted indices), without copy
+        """
+        self.compact()
+        return csr_matrix((self._A.data, self._A.indices, self._A.indptr),
+                          shape=self._A.shape, copy=False)
+
+    def neighbors(self, i):
+        """sorted array of neighbors of node i
+        """
+        A = self._A
+        nbrs = A.indices[A.indptr[i]:A.indptr[i + 1]]
+        if i in self._delta:
+            nbrs = np.union1d(nbrs, list(self._delta[i].keys()))
+        return nbrs
+
+    def signs(self, i, nodes):
+        """
+        Returns:
+        array of the signs of (i, n) for n in nodes (0 for missing edges)
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        A = self._A
+        start, end = A.indptr[i], A.indptr[i + 1]
+        row = A.indices[start:end]
+        pos = np.searchsorted(row, nodes)
+        pos[pos == len(row)] = 0
+        if len(row) > 0:
+            signs = np.where(row[pos] == nodes, A.data[start:end][pos], 0)
+        else:
+            signs = np.zeros(len(nodes))
+        for j, s in self._delta.get(i, {}).items():
+            signs[nodes == j] = s
+        return signs
+
+    def sign(self, i, j):
+        return self.signs(i, [j])[0]
+
+    def has_edge(self, i, j):
+        return self.sign(i, j) != 0
+
+    def to_multigraph(self):
+        """nx.MultiGraph keyed by sign, as `to_multigraph` does
+        """
+        A = self.csr().tocoo()
+        upper = A.row <= A.col
+        g = nx.MultiGraph()
+        g.add_nodes_from(self.nodes())
+        for i, j, s in zip(A.row[upper], A.col[upper], A.data[upper]):
+            s = int(s)
+            g.add_edge(int(i), int(j), key=s, weight=1, sign=s)
+        return g
@@ -1,14 +1,19 @@
 import contexts as ctx
+import pytest
 import numpy as np
+from functools import partial
 from scipy.sparse import csr_matrix
 
 from numpy.testing import assert_almost_equal, assert_allclose
 
 from snpp.utils.data import make_signed_matrix
 from snpp.cores.spectral import build_laplacian_related_matrices, \
-    build_laplacian_related_matrices_sparse
-from snpp.cores.zheng2015 import build_L_sns as build_zheng2015
-from snpp.cores.kunegis2010 import build_L as build_kunegis2010
+    build_laplacian_related_matrices_sparse, \
+    inverse_degree, top_k_eigenvectors
+from snpp.cores.zheng2015 import build_L_sns as build_zheng2015, \
+    build_L_bns, build_L_sns_sparse, build_L_bns_sparse
+from snpp.cores.kunegis2010 import build_L as build_kunegis2010, \
+    build_L_sparse as build_kunegis2010_sparse
 
 
 def test_build_laplacian_related_matrices(Q1):
@@ -54,3 +59,60 @@ def test_build_zheng2015(Q1):
 def test_build_kunegis2010(Q1):
     L = build_kunegis2010(Q1)
     assert L.shape == (4, 4)
+
+
+def test_build_laplacian_sparse(Q1):
+    Q1_sp = csr_matrix(Q1)
+    for build, build_sparse in ((build_zheng2015, partial(build_L_sns_sparse, symmetric=False)),
+                                (build_L_bns, partial(build_L_bns_sparse, symmetric=False)),
+                                (build_kunegis2010, build_kunegis2010_sparse)):
+        L = build_sparse(Q1_sp)
+        assert L.format == 'csr'
+        assert_allclose(build(Q1), L.toarray())
+
+
+@pytest.mark.parametrize('build, build_sparse', [(build_zheng2015, build_L_sns_sparse),
+                                                 (build_L_bns, build_L_bns_sparse)])
+def test_build_zheng2015_sparse_symmetric(build, build_sparse):
+    """D^-1/2 L D^-1/2, with the eigen pairs of D^-1 L, through the symmetric solvers
+    """
+    rng = np.random.RandomState(0)
+    n = 200
+    labels = rng.randint(0, 3, n)
+    W = np.sign(rng.rand(n, n) - 0.9) * (rng.rand(n, n) < 0.1)  # noise
+    W[np.equal.outer(labels, labels) & (rng.rand(n, n) < 0.05)] = 1
+    W[~np.equal.outer(labels, labels) & (rng.rand(n, n) < 0.05)] = -1
+    W = np.triu(W, 1)
+    W = W + W.T
+    L = build_sparse(csr_matrix(W))
+    assert abs(L - L.T).max() < 1e-12
+
+    w_d, V_d = np.linalg.eig(build(W))
+    w_d, V_d = np.real(w_d), np.real(V_d)
+    order = np.argsort(w_d)[:3]
+    w, V = top_k_eigenvectors(L, 3, 'asc', tol=1e-10)
+    assert_allclose(w, w_d[order], atol=1e-8)
+
+    # eigen vectors of D^-1 L
+    _, _, _, _, D_hat = build_laplacian_related_matrices_sparse(csr_matrix(W))
+    V = inverse_degree(D_hat).sqrt() @ V
+    assert_allclose(build(W) @ V, V * w, atol=1e-8)
+
+
+def test_build_zheng2015_sparse_isolated_node(Q1):
+    """no inversion, isolated nodes get an empty row
+    """
+    Q = np.zeros((5, 5))
+    Q[:4, :4] = Q1
+    L = build_L_sns_sparse(csr_matrix(Q), symmetric=False)
+    assert_allclose(build_zheng2015(Q1), L.toarray()[:4, :4])
+    assert build_L_sns_sparse(csr_matrix(Q))[4].nnz == 0
+    assert L[4].nnz == 0
+
+
+def test_build_laplacian_related_matrices_sparse_one_sign(Q1):
+    Q = csr_matrix(np.maximum(Q1, 0))
+    W_p, W_n, D_p, D_n, D_hat = build_laplacian_related_matrices_sparse(Q)
+    assert_allclose(Q.toarray(), W_p.toarray())
+    assert W_n.nnz == 0
+    assert_allclose(D_p.toarray(), D_hat.toarray())
@@ -82,6 +82,27 @@ def test_iterative_approach_louvain(rand_lowrank_g,
     assert_allclose(get_accuracy(true_lowrank_g, preds),
                     0.675)  # should be consistent!
 
+
+
+def test_iterative_approach_warm_start(rand_lowrank_g):
+    g, T, k = parameters(rand_lowrank_g)
+    partitions = []
+
+    def partition_f(g, k, warm_start):
+        partitions.append(warm_start.get('C'))
+        return best_partition(g, k, warm_start=warm_start)
+
+    C, preds = iterative_approach(
+        g, T, k,
+        graph_partition_f=partition_f,
+        budget_allocation_f=exponential_budget,
+        budget_allocation_kwargs=dict(exp_const=2),
+        solve_maxbalance_f=faster_greedy,
+        warm_start=True)
+    assert set((i, j) for i, j, _ in preds) == T
+    assert partitions[0] is None
+    assert all(p is not None for p in partitions[1:])
+
     
 def test_single_run_approach(rand_lowrank_g,
                              true_lowrank_g,
@@ -13,7 +13,14 @@ from snpp.cores.louvain import best_partition, Status, \
     __remove, __insert, __neighcom, \
     induced_graph, \
     __one_level, \
-    split_graph_by_sign
+    split_graph_by_sign, \
+    split_csr_by_sign, ArrayStatus, \
+    generate_dendrogram, generate_dendrogram_csr, \
+    induced_csr, \
+    __one_level_csr, \
+    color_nodes, __one_level_colored, \
+    modularity_csr
+from snpp.cores import louvain
 
 from snpp.utils.data import make_lowrank_matrix
 from snpp.utils.signed_graph import to_multigraph
@@ -32,6 +39,57 @@ def test_detect_community(lowrank_graph):
     assert_allclose(coms, expected)
 
 
+def test_detect_community_networkx(lowrank_graph):
+    expected = np.array(list(chain(*(repeat(i, group_size) for i in range(rank)))))
+
+    part = best_partition(lowrank_graph, 4, method='networkx')
+    assert_allclose([part[i] for i in range(N)], expected)
+
+
+def random_multigraph(n, n_edges, k, seed=0):
+    """noisy signed multigraph of k groups, with random weights (no ties in the gains)
+    """
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(0, k, n)
+    g = nx.MultiGraph()
+    g.add_nodes_from(range(n))
+    for _ in range(n_edges):
+        i, j = rng.randint(0, n, 2)
+        s = (1 if labels[i] == labels[j] else -1) * (1 if rng.rand() > 0.1 else -1)
+        w = rng.rand() + 0.5
+        if g.has_edge(i, j, key=s):
+            g[i][j][s]['weight'] += w
+        else:
+            g.add_edge(i, j, key=s, weight=w, sign=s)
+    return g
+
+
+def test_generate_dendrogram_csr():
+    """same dendrogram as the dict implementation
+    """
+    g = random_multigraph(300, 2000, 4)
+    dendo = generate_dendrogram_csr(g, 4)
+    assert len(dendo) > 1
+    assert dendo == generate_dendrogram(g, 4)
+
+    part_init = {i: i % 10 for i in g.nodes()}
+    assert (generate_dendrogram_csr(g, 4, part_init=part_init)
+            == generate_dendrogram(g, 4, part_init=part_init))
+
+
+@pytest.mark.parametrize('n_jobs', [None, 2])
+def test_best_partition_no_self_loops(n_jobs):
+    """a path +, -, + whose singletons have no internal weight
+    """
+    g = nx.Graph()
+    g.add_edge(0, 1, weight=1, sign=1)
+    g.add_edge(1, 2, weight=1, sign=-1)
+    g.add_edge(2, 3, weight=1, sign=1)
+    part = best_partition(g, 2, n_jobs=n_jobs, seed=0)
+    assert part == best_partition(g, 2, method='networkx')
+    assert part[0] == part[1] != part[2] == part[3]
+
+
 group_size = 2
 rank = 2
 N = group_size * rank
@@ -182,6 +240,16 @@ def test_induced_graph(lowrank_multigraph):
                             edge_match=equal)
 
 
+def test_best_partition_warm_start(lowrank_graph):
+    warm_start = {}
+    part = best_partition(lowrank_graph, 2, warm_start=warm_start)
+    assert warm_start['C'] == part
+    assert part[0] == part[1] != part[2] == part[3]
+
+    # refines the previous partition
+    assert best_partition(lowrank_graph, 2, warm_start=warm_start) == part
+
+
 def test_one_level(lowrank_multigraph):
     s = Status()
     s.init(lowrank_multigraph)
@@ -197,3 +265,186 @@ def test_split_graph_by_sign(lowrank_multigraph):
     gp, gn = split_graph_by_sign(lowrank_multigraph)
     assert set([(0, 0), (0, 1), (1, 1), (2, 2), (2, 3), (3, 3)]) == set(gp.edges())
     assert set([(0, 2), (1, 2), (0, 3), (1, 3)]) == set(gn.edges())
+
+
+def test_split_csr_by_sign(lowrank_multigraph, status_0):
+    nodes, A_p, A_n = split_csr_by_sign(lowrank_multigraph)
+    assert nodes == list(range(N))
+    assert_allclose(A_p.toarray(), [[2, 1, 0, 0],
+                                    [1, 2, 0, 0],
+                                    [0, 0, 2, 1],
+                                    [0, 0, 1, 2]])
+    assert_allclose(A_n.toarray(), [[0, 0, 1, 1],
+                                    [0, 0, 1, 1],
+                                    [1, 1, 0, 0],
+                                    [1, 1, 0, 0]])
+
+
+@pytest.mark.parametrize('part', [None, [0, 0, 1, 1], [0, 1, 0, 1]])
+def test_array_status(lowrank_multigraph, part):
+    s = Status()
+    s.init(lowrank_multigraph, None if part is None else dict(enumerate(part)))
+    _, A_p, A_n = split_csr_by_sign(lowrank_multigraph)
+    a = ArrayStatus(A_p, A_n, part)
+
+    as_array = (lambda d: [d.get(i, 0) for i in range(N)])
+    for name in ('degrees', 'gdegrees', 'loops', 'internals'):
+        for sign in ('_p', '_n'):
+            assert_allclose(getattr(a, name + sign), as_array(getattr(s, name + sign)))
+    assert a.total_weight_p == s.total_weight_p
+    assert a.total_weight_n == s.total_weight_n
+    assert a.node2com.dtype == np.int32
+    assert a.modularity() == __modularity(s)
+
+
+def test_array_status_neighcom(lowrank_multigraph):
+    _, A_p, A_n = split_csr_by_sign(lowrank_multigraph)
+    a = ArrayStatus(A_p, A_n, [0, 1, 1, 2])
+    coms = a.neighcom(0)
+    assert sorted(coms) == [1, 1, 2]
+    assert_allclose(a.scratch[:3], [[0, 0], [1, 1], [0, 1]])
+
+    a.scratch[coms] = 0
+    a.remove(0, 0, a.scratch[0])
+    a.insert(0, 1, [1, 1])
+    b = ArrayStatus(A_p, A_n, [0, 0, 0, 1])
+    assert_allclose(a.degrees[[1, 2]], b.degrees[[0, 1]])
+    assert_allclose(a.internals[[1, 2]], b.internals[[0, 1]])
+
+
+def test_induced_csr(lowrank_multigraph):
+    _, A_p, A_n = split_csr_by_sign(lowrank_multigraph)
+    labels = np.array([0, 0, 1, 1])
+    I_p, I_n = induced_csr(labels, A_p, A_n)
+    assert_allclose(I_p.toarray(), [[6, 0], [0, 6]])  # loops of weight 3
+    assert_allclose(I_n.toarray(), [[0, 4], [4, 0]])
+
+    g = random_multigraph(100, 500, 3)
+    labels = np.random.RandomState(0).randint(0, 7, 100)
+    _, A_p, A_n = split_csr_by_sign(g)
+    I_p, I_n = induced_csr(labels, A_p, A_n)
+    _, G_p, G_n = split_csr_by_sign(induced_graph(dict(enumerate(labels)), g))
+    assert_allclose(I_p.toarray(), G_p.toarray())
+    assert_allclose(I_n.toarray(), G_n.toarray())
+
+    # the communities as nodes: same degrees, internal weights and modularity
+    s = ArrayStatus(A_p, A_n, labels)
+    s_induced = ArrayStatus(I_p, I_n)
+    assert_allclose(s_induced.gdegrees, s.degrees[:7])
+    assert_allclose(s_induced.loops, s.internals[:7])
+    assert_allclose(s_induced.modularity(), s.modularity())
+
+
+def test_running_modularity(lowrank_multigraph):
+    s = Status()
+    s.init(lowrank_multigraph, {0: 0, 1: 1, 2: 1, 3: 1})
+    assert_allclose(s.mod, __modularity(s))
+    __remove(node=1, com=1, weight_p=0, weight_n=2, status=s)
+    assert_allclose(s.mod, __modularity(s))
+    __insert(node=1, com=0, weight_p=1, weight_n=0, status=s)
+    assert_allclose(s.mod, __modularity(s))
+
+    g = random_multigraph(300, 2000, 4)
+    part = {i: i % 10 for i in g.nodes()}
+    s = Status()
+    s.init(g, part)
+    __one_level(g, s)
+    assert_allclose(s.mod, __modularity(s))
+
+    _, A_p, A_n = split_csr_by_sign(g)
+    a = ArrayStatus(A_p, A_n, [part[i] for i in range(300)])
+    __one_level_csr(a)
+    assert_allclose(a.mod, a.modularity())
+    assert_allclose(a.mod, s.mod)
+
+
+def test_one_level_moved_tol(monkeypatch):
+    """moved_tol=1: a single pass
+    """
+    g = random_multigraph(300, 2000, 4)
+    _, A_p, A_n = split_csr_by_sign(g)
+    a = ArrayStatus(A_p, A_n)
+    __one_level_csr(a, moved_tol=1.)
+
+    monkeypatch.setattr(louvain, '__PASS_MAX', 1)
+    b = ArrayStatus(A_p, A_n)
+    __one_level_csr(b)
+    assert (a.node2com == b.node2com).all()
+
+    monkeypatch.setattr(louvain, '__PASS_MAX', -1)
+    c = ArrayStatus(A_p, A_n)
+    __one_level_csr(c)
+    assert not (c.node2com == b.node2com).all()
+
+
+def test_color_nodes():
+    g = random_multigraph(300, 1000, 4)
+    g.add_node(300)  # isolated
+    _, A_p, A_n = split_csr_by_sign(g)
+    a = ArrayStatus(A_p, A_n)
+    colors = color_nodes(a.neighbor_ptr, a.neighbors, seed=0)
+
+    assert sorted(np.concatenate(colors).tolist()) == list(range(300))
+    adjacency = (abs(A_p) + abs(A_n)).tolil()
+    adjacency.setdiag(0)
+    for nodes in colors:
+        assert adjacency[nodes][:, nodes].nnz == 0
+
+    assert all((c1 == c2).all()
+               for c1, c2 in zip(colors, color_nodes(a.neighbor_ptr, a.neighbors, seed=0)))
+
+
+def test_one_level_colored(monkeypatch):
+    g = random_multigraph(300, 2000, 4)
+    _, A_p, A_n = split_csr_by_sign(g)
+
+    statuses = []
+    # colors of 4 to 23 nodes: all in this process, all in the pool, or some of each
+    for n_jobs, min_shard in ((1, 1), (2, 1000), (2, 1), (2, 6)):
+        monkeypatch.setattr(louvain, '__MIN_SHARD', min_shard)
+        a = ArrayStatus(A_p, A_n)
+        __one_level_colored(a, n_jobs=n_jobs, seed=0)
+        statuses.append(a)
+    a = statuses[0]
+    # does not depend on the number of processes
+    for a_2 in statuses[1:]:
+        assert (a.node2com == a_2.node2com).all()
+        assert_allclose(a_2.mod, a.mod)
+
+    # exact bookkeeping
+    fresh = ArrayStatus(A_p, A_n, a.node2com)
+    coms = np.unique(a.node2com)
+    assert_allclose(a.degrees[coms], fresh.degrees[:len(coms)])
+    assert_allclose(a.internals[coms], fresh.internals[:len(coms)])
+    assert_allclose(a.mod, fresh.modularity())
+
+    # about as good as the sequential sweep
+    s = ArrayStatus(A_p, A_n)
+    __one_level_csr(s)
+    assert a.mod > 0.9 * s.mod
+
+
+def test_best_partition_parallel(lowrank_graph):
+    part = best_partition(lowrank_graph, 2, n_jobs=2, seed=0)
+    assert part[0] == part[1] != part[2] == part[3]
+
+
+def test_modularity_csr(lowrank_multigraph):
+    _, A_p, A_n = split_csr_by_sign(lowrank_multigraph)
+    Q, Q_p, Q_n = modularity_csr([0, 0, 1, 1], A_p, A_n)
+    assert_allclose([Q_p, Q_n], [3 / 6 - 2 * (6 / 12)**2, - 2 * (4 / 8)**2])
+    assert_allclose(Q, Q_p - Q_n)
+    # any labels
+    assert modularity_csr(['a', 'a', 'b', 'b'], A_p, A_n) == (Q, Q_p, Q_n)
+
+    g = random_multigraph(300, 2000, 4)
+    part = {i: i % 10 for i in g.nodes()}
+    s = Status()
+    s.init(g, part)
+    _, A_p, A_n = split_csr_by_sign(g)
+    assert_allclose(modularity_csr([part[i] for i in range(300)], A_p, A_n)[0],
+                    __modularity(s))
+
+    # no negative edge
+    Q, Q_p, Q_n = modularity_csr([0, 0, 1, 1], A_p[:4, :4], csr_matrix((4, 4)))
+    assert Q_n == 0 and Q == Q_p
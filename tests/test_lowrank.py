@@ -7,10 +7,22 @@ import networkx as nx
 from numpy.testing import assert_almost_equal, assert_allclose
 from sklearn.metrics import adjusted_rand_score
 
+from scipy import sparse
 from snpp.cores.lowrank import alq, alq_spark, \
+    alq_with_weight, \
+    weighted_partition_sparse, \
+    get_error, \
+    get_error_sparse, \
     alq_weighted_spark, \
+    alq_local, \
+    init_factors, \
     partition_graph, \
-    partition_sparse
+    partition_sparse, \
+    predict_signs, \
+    predict_signs_chunked, \
+    sgd_factors
+from snpp.cores.spectral import predict_cluster_labels_svd
+from snpp.utils.matrix import save_edges
 
 
 random_seed = 123456
@@ -27,6 +39,137 @@ def test_lowrank_alq_dense(Q1, Q1_result):
                             Q1_result)
 
 
+def test_lowrank_alq_truncated_svd_init(Q1, sparse_Q1, Q1_result):
+    for m in ["randomized", "lanczos"]:
+        for Q in (Q1, sparse_Q1):
+            X, Y = init_factors(Q, 2, m)
+            assert X.shape == (4, 2) and Y.shape == (2, 4)
+            X, Y, _ = alq(Q, k=2, lambda_=0.1,
+                          max_iter=10,
+                          init_method=m)
+            assert_almost_equal(np.sign(np.dot(X, Y)),
+                                Q1_result)
+
+
+def test_init_factors_svd_methods():
+    """the SVD initializations agree (up to the signs of the singular vectors)
+    """
+    rng = np.random.RandomState(0)
+    Q = rng.normal(size=(30, 3)).dot(np.diag([10., 5., 3.])).dot(rng.normal(size=(3, 20)))
+    Q += 0.01 * rng.normal(size=Q.shape)
+    np.random.seed(0)
+    XY = [np.dot(*init_factors(M, 3, m))
+          for m, M in [('svd', Q), ('svd', sparse.csr_matrix(Q)),
+                       ('lanczos', Q), ('randomized', Q)]]
+    for M in XY[1:]:
+        assert_allclose(M, XY[0], atol=1e-6)
+    # X = U S^{1/2}, Y = S^{1/2} V^T
+    X, Y = init_factors(Q, 3, 'svd')
+    assert_allclose(np.linalg.norm(X, axis=0), np.linalg.norm(Y, axis=1))
+
+
+def test_lowrank_alq_batched(Q1, sparse_Q1, Q1_result):
+    """same iterates as the loop version, dense or sparse input
+    """
+    for m in ["random", "svd"]:
+        np.random.seed(random_seed)
+        X, Y, errors = alq(Q1, k=2, lambda_=0.1, max_iter=30,
+                           init_method=m, method='loop')
+        for Q in (Q1, sparse_Q1):
+            np.random.seed(random_seed)
+            X_b, Y_b, errors_b = alq(Q, k=2, lambda_=0.1, max_iter=30,
+                                     init_method=m, method='batched',
+                                     batch_size=3)
+            if m == 'random':
+                assert_allclose(X_b, X, atol=1e-8)
+                assert_allclose(Y_b, Y, atol=1e-8)
+                assert_allclose(errors_b, errors)
+            assert_almost_equal(np.sign(np.dot(X_b, Y_b)),
+                                Q1_result)
+
+
+def test_get_error_sparse(Q1, sparse_Q1):
+    rng = np.random.RandomState(0)
+    X, Y = rng.normal(size=(4, 2)), rng.normal(size=(2, 4))
+    assert_allclose(get_error_sparse(sparse_Q1, X, Y, chunk_size=3),
+                    get_error(Q1, X, Y, np.sign(np.abs(Q1))))
+
+
+def test_lowrank_alq_early_stopping(rand_lowrank_mat):
+    np.random.seed(random_seed)
+    X, Y, errors, trace = alq(rand_lowrank_mat, k=rank, lambda_=0.1,
+                              max_iter=100, init_method='lanczos',
+                              tol=1e-3, return_trace=True)
+    assert 1 < len(errors) < 100
+    assert trace['error'] == errors
+    assert len(trace['time']) == len(errors)
+    assert np.all(np.diff(trace['time']) >= 0)
+    assert errors[-2] - errors[-1] <= 1e-3 * errors[-2]
+
+    # hold out some of the observations
+    A = rand_lowrank_mat.tocoo()
+    held_out = np.arange(A.nnz) % 5 == 0
+    train = sparse.csr_matrix((A.data[~held_out], (A.row[~held_out], A.col[~held_out])),
+                              shape=A.shape)
+    validation = sparse.csr_matrix((A.data[held_out], (A.row[held_out], A.col[held_out])),
+                                   shape=A.shape)
+    X, Y, errors, trace = alq(train, k=rank, lambda_=0.1,
+                              max_iter=100, init_method='lanczos',
+                              validation=validation, return_trace=True)
+    assert len(trace['validation_error']) == len(errors)
+    assert_allclose(get_error_sparse(validation, X, Y),
+                    min(trace['validation_error']))
+
+
+def test_lowrank_alq_weighted(Q1, sparse_Q1, Q1_result):
+    rng = np.random.RandomState(0)
+    W = rng.uniform(0.5, 2, size=Q1.shape)
+    W[0, 2] = W[2, 0] = 0  # drops the observations
+
+    Q1_dropped = Q1.copy()
+    Q1_dropped[0, 2] = Q1_dropped[2, 0] = 0
+    runs = {}
+    for name, Q, weights, method in [('ones', Q1, np.ones(Q1.shape), 'batched'),
+                                     ('unweighted', Q1, None, 'batched'),
+                                     ('loop', Q1, W, 'loop'),
+                                     ('batched', sparse_Q1, sparse.csr_matrix(W), 'batched'),
+                                     ('dropped', Q1_dropped, W, 'batched')]:
+        np.random.seed(random_seed)
+        runs[name] = alq_with_weight(Q, weights, k=2, lambda_=0.1, max_iter=10,
+                                     method=method)
+
+    for a, b in [('ones', 'unweighted'), ('loop', 'batched'), ('batched', 'dropped')]:
+        for x, y in zip(runs[a], runs[b]):
+            assert_allclose(x, y, atol=1e-8)
+    assert not np.allclose(runs['batched'][2], runs['unweighted'][2])
+
+    # all the entries observed (the dropped ones are the only negative ones)
+    W[0, 2] = W[2, 0] = 1
+    X, Y = alq_weighted_spark(sparse_Q1, W, 2, None, lambda_=0.1, iterations=20,
+                              seed=random_seed)
+    assert_almost_equal(np.sign(np.dot(X, Y)),
+                        Q1_result)
+    labels = weighted_partition_sparse(sparse_Q1, W, 2, lambda_=0.1, iterations=20,
+                                       seed=random_seed)
+    assert adjusted_rand_score(labels, [0, 0, 1, 1]) == 1.0
+
+
+def test_lowrank_alq_warm_start(Q1, Q1_result):
+    warm_start = {}
+    X, Y, errors = alq(Q1, k=2, lambda_=0.1, max_iter=30,
+                       init_method='svd',
+                       warm_start=warm_start)
+    assert warm_start['X'] is X and warm_start['Y'] is Y
+
+    # one sweep from the previous factors is about as good as the full run
+    X1, Y1, errors1 = alq(Q1, k=2, lambda_=0.1, max_iter=1,
+                          warm_start=warm_start)
+    assert_allclose(errors1[0], errors[-1], rtol=0.01)
+    assert errors1[0] < errors[0]
+    assert_almost_equal(np.sign(np.dot(X1, Y1)),
+                        Q1_result)
+
+
 def test_lowrank_alq_spark(sparse_Q1, Q1_result, spark_context):
     """
     Borrowed from here:
@@ -44,6 +187,112 @@ def test_lowrank_alq_spark(sparse_Q1, Q1_result, spark_context):
                         Q1_result)
 
 
+def test_lowrank_alq_local(sparse_Q1, Q1_result):
+    X, Y = alq_local(sparse_Q1, k=2, lambda_=0.1, iterations=20,
+                     seed=random_seed, n_jobs=1)
+    assert_almost_equal(np.sign(np.dot(X, Y)),
+                        Q1_result)
+
+    # threads over batches of rows
+    X_t, Y_t = alq_local(sparse_Q1, k=2, lambda_=0.1, iterations=20,
+                         seed=random_seed, n_jobs=2, batch_size=1)
+    assert_allclose(X_t, X)
+    assert_allclose(Y_t, Y)
+
+    preds = predict_signs(X, Y, [(0, 1), (0, 2), (3, 1)])
+    assert preds == [(0, 1, 1), (0, 2, -1), (3, 1, -1)]
+
+
+def test_lowrank_alq_local_empty_row():
+    """a node with no observation (e.g. after a train/test split)
+    """
+    A = sparse.csr_matrix(np.array([[1, 1, -1, 0],
+                                    [1, 1, -1, 0],
+                                    [-1, -1, 1, 0],
+                                    [0, 0, 0, 0]]))
+    X, Y = alq_local(A, 2, 5, 0.1, seed=random_seed, n_jobs=1)
+    assert np.all(np.isfinite(X)) and np.all(np.isfinite(Y))
+    assert_allclose(X[3], 0)
+    assert_allclose(Y[:, 3], 0)
+
+    labels = partition_sparse(A, 2, iterations=5, lambda_=0.1, seed=random_seed)
+    assert labels[0] == labels[1] != labels[2]
+
+
+def test_predict_signs_chunked(tmpdir):
+    rng = np.random.RandomState(0)
+    X, Y = rng.normal(size=(20, 3)), rng.normal(size=(3, 20))
+    targets = rng.randint(0, 20, size=(1000, 2))
+    expected = np.dot(X, Y)[targets[:, 0], targets[:, 1]]
+
+    signs, scores = predict_signs_chunked(X, Y, targets, chunk_size=64,
+                                          n_jobs=2, return_scores=True)
+    assert_allclose(scores, expected)
+    assert (signs == np.sign(expected)).all()
+
+    # streamed from and to memory-mapped files
+    path = str(tmpdir.join('targets.npy'))
+    np.save(path, targets)
+    out = np.lib.format.open_memmap(str(tmpdir.join('signs.npy')), mode='w+',
+                                    dtype=np.int8, shape=(len(targets), ))
+    predict_signs_chunked(X, Y, np.load(path, mmap_mode='r'), chunk_size=100,
+                          signs_out=out)
+    out.flush()
+    assert (np.load(str(tmpdir.join('signs.npy'))) == signs).all()
+
+    signs_cols = predict_signs_chunked(X, Y, (targets[:, 0], targets[:, 1]))
+    assert (signs_cols == signs).all()
+
+
+def test_sgd_factors(rand_lowrank_mat, tmpdir):
+    path = str(tmpdir.join('edges.npy'))
+    save_edges(path, rand_lowrank_mat)
+    edges = np.load(path, mmap_mode='r')
+
+    for method, learning_rate in (('adagrad', 0.1), ('sgd', 0.5)):
+        X, Y = sgd_factors(edges, rank, method=method,
+                           learning_rate=learning_rate,
+                           epochs=200, batch_size=8, block_size=20,
+                           seed=random_seed, verbose=False)
+        assert X.shape == (N, rank) and Y.shape == (rank, N)
+        _, labels = predict_cluster_labels_svd(X, rank, order='desc')
+        assert adjusted_rand_score(labels, true_labels) == 1.0
+
+        rows, cols = rand_lowrank_mat.nonzero()
+        signs = predict_signs_chunked(X, Y, (rows, cols))
+        assert (signs == np.asarray(rand_lowrank_mat[rows, cols]).ravel()).all()
+
+
+def test_sgd_factors_checkpoint(rand_lowrank_mat, tmpdir):
+    path = str(tmpdir.join('edges.npy'))
+    save_edges(path, rand_lowrank_mat)
+    edges = np.load(path, mmap_mode='r')
+    checkpoint = str(tmpdir.join('factors.npz'))
+
+    kwargs = dict(batch_size=8, block_size=20, seed=random_seed, verbose=False)
+    X, Y = sgd_factors(edges, rank, epochs=6, **kwargs)
+
+    # interrupted after 3 epochs, then resumed
+    sgd_factors(edges, rank, epochs=3, checkpoint=checkpoint, **kwargs)
+    X_r, Y_r = sgd_factors(edges, rank, epochs=6, checkpoint=checkpoint, **kwargs)
+    assert_allclose(X_r, X)
+    assert_allclose(Y_r, Y)
+    assert np.load(checkpoint)['epoch'] == 5
+
+
+def test_partition_graph_local(g1, rand_lowrank_g):
+    labels = partition_graph(g1, k=2,
+                             iterations=20, lambda_=0.1,
+                             seed=random_seed)
+    assert adjusted_rand_score(labels, [0, 0, 1, 1]) == 1.0
+
+    labels = partition_graph(rand_lowrank_g,
+                             k=rank,
+                             iterations=20, lambda_=0.1,
+                             seed=random_seed)
+    assert adjusted_rand_score(labels, true_labels) == 1.0
+
+
 def test_partition_graph_simple(g1, spark_context):
     labels = partition_graph(g1, k=2,
                              sc=spark_context,
@@ -1,12 +1,15 @@
 import contexts as ctx
 
 import numpy as np
+import networkx as nx
 from scipy.sparse import isspmatrix_csr
 
 from snpp.cores.max_balance import greedy, greedy_g, \
     faster_greedy, \
     edge_weight_sum
-from snpp.cores.triangle import build_edge2edges
+from snpp.cores.triangle import build_edge2edges, TriangleCountCache, \
+    first_order_triangles_net_count_g
+from snpp.utils.signed_graph import SignedGraph
 # from test_triangle import A6, g6
 
 
@@ -66,6 +69,53 @@ def test_faster_greedy_3(g6):
 def test_faster_greedy_4(g6):
     preds = faster_greedy(g6, C, B=10,
                           T={(0, 1), (1, 5), (2, 5), (2, 3), (3, 5)})
-    assert preds == [(2, 3, 1), (0, 1, -1), (2, 5, -1), (1, 5, -1), (3, 5, -1)]
+    assert preds == [(2, 3, 1), (0, 1, -1), (1, 5, -1), (2, 5, -1), (3, 5, -1)]
     assert not g6.has_edge(4, 5)
     assert not g6.has_edge(0, 1)
+
+
+def test_faster_greedy_cache(g6):
+    T = {(0, 1), (1, 5), (2, 5), (2, 3), (3, 5)}
+    cache = TriangleCountCache(T)
+    g = g6.copy()
+    preds = faster_greedy(g, C, B=2, T=T, triangle_cache=cache)
+    assert preds == faster_greedy(g6, C, B=2, T=T)
+
+    g.add_edges_from((i, j, {'weight': 1, 'sign': s}) for i, j, s in preds)
+    remaining = T - set((i, j) for i, j, _ in preds)
+    assert (faster_greedy(g, C, B=10, T=remaining, triangle_cache=cache)
+            == faster_greedy(g, C, B=10, T=remaining))
+
+
+def test_faster_greedy_signed_graph(g6):
+    sg = SignedGraph.from_graph(g6)
+    assert faster_greedy(sg, C, B=2, T=targets) == faster_greedy(g6, C, B=2, T=targets)
+    assert not sg.has_edge(4, 5)  # no side effect
+
+
+def test_faster_greedy_best_net_count():
+    """every pick has the best net count of a full recount, as in `greedy_g`
+    """
+    rng = np.random.RandomState(0)
+    for _ in range(10):
+        n = 30
+        C = rng.randint(0, 3, n)
+        g = nx.Graph()
+        g.add_nodes_from(range(n))
+        T = set()
+        for i, j in zip(*np.triu_indices(n, 1)):
+            r = rng.rand()
+            if r < 0.2:
+                g.add_edge(i, j, weight=1, sign=(1 if C[i] == C[j] else -1))
+            elif r < 0.3:
+                T.add((i, j))
+
+        preds = faster_greedy(g, C, B=15, T=T)
+        assert len(preds) == 15
+        g = g.copy()
+        for n1, n2, s in preds:
+            counts = {(i, j): (sign, nc) for i, j, sign, nc, _, _
+                      in first_order_triangles_net_count_g(g, C, T)}
+            assert counts[(n1, n2)] == (s, max(nc for _, nc in counts.values()))
+            T.remove((n1, n2))
+            g.add_edge(n1, n2, weight=1, sign=s)
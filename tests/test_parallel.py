@@ -0,0 +1,52 @@
+import contexts as ctx
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from snpp.utils.parallel import share_array, attach_array, \
+    shard_bounds, map_shards, worker_arrays, n_workers, \
+    SharedArrayPool
+
+
+def _shard_sum(bounds):
+    start, end = bounds
+    return worker_arrays()['x'][start:end].sum(axis=0)
+
+
+def test_share_array():
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)
+    b = attach_array(share_array(a))
+    assert b.dtype == a.dtype
+    assert_allclose(a, b)
+
+    assert attach_array(share_array(np.zeros((0, 2)))).shape == (0, 2)
+
+
+def test_shard_bounds():
+    assert shard_bounds(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert shard_bounds(2, 4) == [(0, 1), (1, 2)]
+    assert shard_bounds(0, 4) == []
+
+
+def test_map_shards():
+    x = np.arange(20).reshape(10, 2)
+    sums = map_shards(_shard_sum, {'x': x}, len(x), n_jobs=2)
+    assert len(sums) == 8
+    assert_allclose(np.sum(sums, axis=0), x.sum(axis=0))
+
+
+def test_shared_array_pool():
+    x = np.arange(20).reshape(10, 2)
+    with SharedArrayPool({'x': x}, n_jobs=2) as pool:
+        bounds = shard_bounds(len(x), 4)
+        assert_allclose(np.sum(pool.map(_shard_sum, bounds), axis=0), x.sum(axis=0))
+
+        # updated in place, seen by the workers
+        pool.arrays['x'][:] *= 2
+        assert_allclose(np.sum(pool.map(_shard_sum, bounds), axis=0), 2 * x.sum(axis=0))
+
+
+def test_n_workers():
+    assert n_workers(None) == 1
+    assert n_workers(3) == 3
+    assert n_workers(-1) >= 1
@@ -0,0 +1,37 @@
+import contexts as ctx
+
+import pytest
+
+from snpp.utils.priority_queue import BucketQueue
+
+
+def test_bucket_queue_order():
+    q = BucketQueue()
+    for item, key in [('a', 1), ('b', 3), ('c', 3), ('d', 0)]:
+        q.push(item, key)
+    assert len(q) == 4
+    assert [q.pop() for _ in range(4)] == [('b', 3), ('c', 3), ('a', 1), ('d', 0)]
+    assert len(q) == 0
+    with pytest.raises(IndexError):
+        q.pop()
+
+
+def test_bucket_queue_rank():
+    q = BucketQueue()
+    q.push('a', 2, rank=1)
+    q.push('b', 2, rank=0)
+    assert q.peek() == ('b', 2)
+
+
+def test_bucket_queue_update():
+    q = BucketQueue()
+    for i, key in enumerate([5, 4, 4, 1]):
+        q.push(i, key)
+
+    q.push(0, 2)  # decrease
+    q.push(3, 4)  # increase, tie with 1 and 2 but inserted later
+    q.push(2, 2)
+    q.push(2, 4)  # back to the same key
+    assert 0 in q
+    assert [q.pop() for _ in range(4)] == [(1, 4), (2, 4), (3, 4), (0, 2)]
+    assert 2 not in q
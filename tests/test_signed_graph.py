@@ -8,7 +8,10 @@ from scipy.sparse import csr_matrix, isspmatrix_csr
 from snpp.utils.signed_graph import symmetric_stat, \
     fill_diagonal, \
     make_symmetric, \
-    matrix2graph
+    matrix2graph, \
+    g2csr, \
+    to_multigraph, \
+    SignedGraph
 
 
 def test_symmetric_stat(Q1_d):
@@ -59,3 +62,38 @@ def test_matrix2graph(Q1_d):
     assert gm[0][0][1]['sign'] == g[0][0]['sign'] == 1
     assert gm[2][3][1]['sign'] == g[2][3]['sign'] == 1
     assert gm[0][2][-1]['sign'] == g[0][2]['sign'] == -1
+
+
+def test_signed_graph(g6):
+    sg = SignedGraph.from_graph(g6, compact_size=3)
+    assert sg.number_of_nodes() == g6.number_of_nodes()
+    assert sg.number_of_edges() == g6.number_of_edges()
+    for i in g6.nodes():
+        assert list(sg.neighbors(i)) == sorted(g6.adj[i])
+        for j in g6.adj[i]:
+            assert sg.sign(i, j) == g6[i][j]['sign']
+    assert not sg.has_edge(0, 1)
+
+    snapshot = sg.csr()
+    assert isspmatrix_csr(snapshot)
+    assert np.shares_memory(snapshot.data, sg.csr().data)  # no copy
+
+    sg_copy = sg.copy()
+    sg_copy.add_edge(0, 1, sign=-1)  # buffered
+    assert sg_copy.sign(0, 1) == sg_copy.sign(1, 0) == -1
+    assert 1 in sg_copy.neighbors(0)
+    assert not sg.has_edge(0, 1)
+    sg_copy.add_edges_from([(4, 5, {'weight': 1, 'sign': 1}),
+                            (0, 1, 1)])  # compacted
+    assert sg_copy._n_delta == 0
+    assert sg_copy.sign(0, 1) == 1
+    assert sg_copy.number_of_edges() == g6.number_of_edges() + 2
+
+    # snapshots are not changed by later insertions
+    assert snapshot[0, 1] == 0
+    g6.add_edges_from([(0, 1, {'sign': 1}), (4, 5, {'sign': 1})])
+    assert (sg_copy.csr() != g2csr(g6)).nnz == 0
+
+    def edges(mg):
+        return sorted((min(i, j), max(i, j), s) for i, j, s in mg.edges(keys=True))
+    assert edges(to_multigraph(sg_copy)) == edges(to_multigraph(g6))
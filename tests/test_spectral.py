@@ -1,11 +1,17 @@
 import contexts as ctx
 import pytest
+import numpy as np
 
 from numpy.testing import assert_allclose
 from scipy.sparse import csr_matrix
-from snpp.cores.kunegis2010 import build_L
+from snpp.cores.kunegis2010 import build_L, build_L_sparse
 from snpp.cores.spectral import predict_cluster_labels, predict_cluster_labels_sparse, \
-    predict_cluster_labels_svd
+    predict_cluster_labels_svd, \
+    predict_cluster_labels_factors, \
+    factor_embedding, \
+    top_k_eigenvectors, \
+    matrix_fingerprint, \
+    SpectralEmbedding
 from sklearn.metrics import adjusted_rand_score
 
 
@@ -24,3 +30,152 @@ def test_svd(Q1):
     _, labels = predict_cluster_labels_svd(L, k=2, order='asc')
     assert adjusted_rand_score([0, 0, 1, 1], labels) == 1.0
 
+
+
+def test_warm_start(Q1):
+    L = build_L(Q1)
+    warm_start = {}
+    _, labels = predict_cluster_labels_svd(L, k=2, order='asc',
+                                           warm_start=warm_start)
+    assert (warm_start['C'] == labels).all()
+    assert warm_start['centroids'].shape == (2, 2)
+
+    # same clusters, same numbering
+    _, labels_warm = predict_cluster_labels(L, k=2, order='asc',
+                                            warm_start=warm_start)
+    assert (labels_warm == labels).all()
+
+
+def test_factor_embedding():
+    """same vectors as the decomposition of the n x n matrix, up to sign
+    """
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(30, 3))
+    Y = np.dot(np.diag([3., 2., 1.]), X.T)
+    M = np.dot(X, Y)
+
+    w, V = factor_embedding(X, Y, 'eig')
+    w_d, V_d = np.linalg.eigh(M)
+    assert_allclose(w, w_d[::-1][:3])
+    assert_allclose(np.abs(np.sum(V * V_d[:, ::-1][:, :3], axis=0)), 1)
+
+    s, U = factor_embedding(X, Y, 'svd')
+    U_d, s_d, _ = np.linalg.svd(M)
+    assert_allclose(s, s_d[:3])
+    assert_allclose(np.abs(np.sum(U * U_d[:, :3], axis=0)), 1)
+
+
+def test_predict_cluster_labels_factors():
+    rng = np.random.RandomState(0)
+    true_labels = np.repeat(np.arange(3), 10)
+    X = np.eye(3)[true_labels] + rng.normal(scale=0.1, size=(30, 3))
+    Y = X.T
+    for method, predict in (('eig', predict_cluster_labels),
+                            ('svd', predict_cluster_labels_svd)):
+        _, labels = predict_cluster_labels_factors(X, Y, 3, method=method)
+        _, labels_dense = predict(np.dot(X, Y), 3, order='desc')
+        assert adjusted_rand_score(labels, labels_dense) == 1.0
+        assert adjusted_rand_score(labels, true_labels) == 1.0
+
+
+def planted_laplacian(n, k, seed=0):
+    """sparse laplacian of a random balanced signed graph with k clusters
+    """
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(0, k, n)
+    i, j = rng.randint(0, n, 10 * n), rng.randint(0, n, 10 * n)
+    W = csr_matrix((np.where(labels[i] == labels[j], 1., -1.), (i, j)), shape=(n, n))
+    W = W + W.T
+    W.data = np.sign(W.data)
+    W.eliminate_zeros()
+    return build_L_sparse(W), labels
+
+
+@pytest.mark.parametrize('order,kwargs', [
+    ('asc', dict(solver='eigsh')),
+    ('asc', dict(solver='eigsh', shift_invert=True)),
+    ('asc', dict(solver='lobpcg', random_state=0)),
+    ('desc', dict(solver='eigsh')),
+    ('desc', dict(solver='lobpcg', random_state=0))])
+def test_top_k_eigenvectors(order, kwargs):
+    L, _ = planted_laplacian(300, 3)
+    w_d = np.linalg.eigvalsh(L.toarray())
+    if order == 'desc':
+        w_d = w_d[::-1]
+    w, V = top_k_eigenvectors(L, 3, order, **kwargs)
+    assert_allclose(w, w_d[:3], rtol=1e-6)
+    assert_allclose(L.dot(V), V * w, atol=1e-4)
+
+
+def test_top_k_eigenvectors_not_symmetric():
+    L, _ = planted_laplacian(50, 2)
+    L = L.tolil()
+    L[0, 1] += 1
+    for A in (L.tocsr(), L.toarray()):
+        with pytest.raises(AssertionError):
+            top_k_eigenvectors(A, 2, 'asc')
+
+
+def test_predict_cluster_labels_top_k():
+    L, true_labels = planted_laplacian(300, 3)
+    for solver in ('eigsh', 'lobpcg'):
+        warm_start = {}
+        _, labels = predict_cluster_labels(L, 3, 'asc', warm_start=warm_start,
+                                           solver=solver)
+        assert adjusted_rand_score(true_labels, labels) == 1.0
+        assert warm_start['V'].shape == (300, 3)
+
+        # from the previous eigen vectors
+        _, labels_warm = predict_cluster_labels(L, 3, 'asc', warm_start=warm_start,
+                                                solver=solver, maxiter=5)
+        assert (labels_warm == labels).all()
+
+
+def test_matrix_fingerprint(Q1):
+    assert matrix_fingerprint(Q1) == matrix_fingerprint(csr_matrix(Q1))
+    assert matrix_fingerprint(csr_matrix(Q1)) == matrix_fingerprint(csr_matrix(Q1).tocoo())
+    Q = Q1.copy()
+    Q[0, 1] = -Q[0, 1]
+    assert matrix_fingerprint(Q1) != matrix_fingerprint(Q)
+
+
+def test_spectral_embedding_cache(tmpdir):
+    L, true_labels = planted_laplacian(300, 3)
+    cache_dir = str(tmpdir.join('cache'))
+
+    emb = SpectralEmbedding(L, 5, 'asc', cache_dir=cache_dir)
+    assert not emb.from_cache
+    w, V = top_k_eigenvectors(L, 5, 'asc')
+    assert_allclose(emb.w, w)
+
+    # same matrix, smaller k: from the cache
+    emb_3 = SpectralEmbedding(L.tocoo(), 3, 'asc', cache_dir=cache_dir)
+    assert emb_3.from_cache
+    assert_allclose(emb_3.V, emb.V[:, :3])
+    # other order or larger k: computed again
+    assert not SpectralEmbedding(L, 3, 'desc', cache_dir=cache_dir).from_cache
+    assert not SpectralEmbedding(L, 6, 'asc', cache_dir=cache_dir).from_cache
+    # other solver settings: computed again
+    assert not SpectralEmbedding(L, 3, 'asc', cache_dir=cache_dir,
+                                 solver='lobpcg', random_state=0).from_cache
+    assert not SpectralEmbedding(L, 3, 'asc', cache_dir=cache_dir, tol=1e-3).from_cache
+    assert SpectralEmbedding(L, 3, 'asc', cache_dir=cache_dir, tol=1e-3).from_cache
+    # the initial vectors only speed up the solver
+    assert SpectralEmbedding(L, 3, 'asc', cache_dir=cache_dir, V0=V).from_cache
+
+    _, labels = emb.predict_cluster_labels(3)
+    assert adjusted_rand_score(true_labels, labels) == 1.0
+
+
+def test_spectral_embedding_sweep():
+    L, true_labels = planted_laplacian(300, 3)
+    emb = SpectralEmbedding(L, 5, 'asc')
+    labels = emb.sweep([2, 3, 4, 5], random_state=0)
+    assert sorted(labels) == [2, 3, 4, 5]
+    assert adjusted_rand_score(true_labels, labels[3]) == 1.0
+    for k, l in labels.items():
+        assert len(np.unique(l)) == k
+
+    labels_par = emb.sweep([2, 3, 4, 5], n_jobs=2, random_state=0)
+    for k in labels:
+        assert (labels_par[k] == labels[k]).all()
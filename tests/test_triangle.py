@@ -3,6 +3,7 @@ import contexts as ctx
 import pytest
 import numpy as np
 
+from numpy.testing import assert_allclose
 from scipy.sparse import csr_matrix
 from nose.tools import assert_raises
 
@@ -12,8 +13,22 @@ from snpp.cores.triangle import extract_nodes_and_signs, \
     first_order_triangles_count, \
     first_order_triangles_count_g, \
     first_order_triangles_net_count_g, \
-    build_edge2edges
-from snpp.utils.signed_graph import matrix2graph
+    first_order_triangles_count_csr, \
+    first_order_triangles_count_spgemm, \
+    first_order_triangles_net_count_csr, \
+    build_edge2edges, \
+    build_edge2edges_csr, \
+    Edge2Edges, \
+    changed_nodes, \
+    TriangleCountCache
+from snpp.utils.signed_graph import matrix2graph, g2csr, SignedGraph
+
+
+def random_signed_graph(n=30, p=0.3, seed=12345):
+    rng = np.random.RandomState(seed)
+    A = np.triu(rng.choice([-1, 0, 1], size=(n, n), p=[p / 2, 1 - p, p / 2]), 1)
+    A = A + A.T + np.eye(n)
+    return matrix2graph(csr_matrix(A), None, multigraph=False)
 
 
 def test_extract_nodes_and_signs():
@@ -80,6 +95,30 @@ def test_first_order_triangles_count(A6):
                           (2, 3, 1, 2), (4, 5, 1, 1)}
 
 
+def test_first_order_triangles_count_loop(A6):
+    C2 = np.array(['a', 'b', 'c', 'c', 'd', 'x'])
+    T = [(0, 1), (2, 3), (4, 5)]
+    assert (set(first_order_triangles_count(A6, C2, T, method='loop'))
+            == set(first_order_triangles_count(A6, C2, T, method='spgemm')))
+
+
+def test_first_order_triangles_count_spgemm():
+    """same as the CSR neighbor intersection version
+    """
+    g = random_signed_graph()
+    n = g.number_of_nodes()
+    C = np.random.RandomState(1).randint(0, 4, n)
+    T = [(i, j) for i in range(n) for j in range(i + 1, n)
+         if not g.has_edge(i, j)]
+
+    expected = first_order_triangles_count_csr(g2csr(g), C, T)
+    for chunk_size in (7, 2**16):
+        actual = first_order_triangles_count_spgemm(g2csr(g), C, T,
+                                                    chunk_size=chunk_size)
+        assert_allclose(actual[0], expected[0])
+        assert_allclose(actual[1], expected[1])
+
+
 def test_first_order_triangles_count_g(g6):
     """pass nx.Graph as parameter
     """
@@ -118,6 +157,54 @@ def test_first_order_triangles_net_count_g(g6):
                           (4, 5, 1, 1, (0, 1), tuple({'s+1': 1}.items()))}
 
 
+def test_first_order_triangles_count_csr(g6):
+    C2 = np.array(['a', 'b', 'c', 'c', 'd', 'x'])
+    count_by_sign, count_by_type = first_order_triangles_count_csr(
+        g2csr(g6), C2, T=[(0, 1), (2, 3), (4, 5)])
+    assert count_by_sign.tolist() == [[2, 1], [0, 2], [0, 1]]
+    assert count_by_type.tolist() == [[1, 0, 2], [2, 0, 0], [1, 0, 0]]
+
+
+def test_first_order_triangles_net_count_csr():
+    """same as the nx.Graph version
+    """
+    g = random_signed_graph()
+    n = g.number_of_nodes()
+    C = np.random.RandomState(1).randint(0, 4, n)
+    T = [(i, j) for i in range(n) for j in range(i + 1, n)
+         if not g.has_edge(i, j)]
+
+    def normalize(rows):
+        return {r[:5] + (frozenset(r[5]), ) for r in rows}
+
+    expected = normalize(first_order_triangles_net_count_g(g, C, T))
+    for chunk_size in (1, 50, 2**22):
+        actual = normalize(first_order_triangles_net_count_csr(
+            g2csr(g), C, T, chunk_size=chunk_size))
+        assert actual == expected
+
+
+def test_first_order_triangles_count_signed_graph():
+    """SignedGraph gives the same counts as nx.Graph, including buffered edges
+    """
+    g = random_signed_graph()
+    n = g.number_of_nodes()
+    C = np.random.RandomState(1).randint(0, 4, n)
+    T = [(i, j) for i in range(n) for j in range(i + 1, n)
+         if not g.has_edge(i, j)]
+    sg = SignedGraph.from_graph(g)
+    for i, j in T[:10]:
+        g.add_edge(i, j, sign=1)
+        sg.add_edge(i, j, sign=1)
+
+    def normalize(rows):
+        return {r[:5] + (frozenset(r[5]), ) for r in rows}
+
+    assert (set(first_order_triangles_count_g(sg, C, T))
+            == set(first_order_triangles_count_g(g, C, T)))
+    assert (normalize(first_order_triangles_net_count_g(sg, C, T))
+            == normalize(first_order_triangles_net_count_g(g, C, T)))
+
     
 def test_build_edge2edges(g6):
     e2es = build_edge2edges(g6, T={(0, 1), (1, 5), (2, 5), (2, 3), (3, 5)})
@@ -126,3 +213,90 @@ def test_build_edge2edges(g6):
                           (2, 5): {(1, 5), (2, 3), (3, 5)},
                           (2, 3): {(2, 5), (3, 5)},
                           (3, 5): {(1, 5), (2, 3), (2, 5)}}
+
+
+def test_build_edge2edges_csr(g6, tmpdir):
+    T = {(0, 1), (1, 5), (2, 5), (2, 3), (3, 5)}
+    e2es = build_edge2edges_csr(g2csr(g6), T)
+    assert isinstance(e2es, Edge2Edges)
+    assert len(e2es) == len(T)
+    assert set(e2es) == T
+    assert (4, 5) not in e2es
+    assert e2es[(4, 5)] == []
+
+    expected = build_edge2edges(g6, T)
+    assert {e: set(e2es[e]) for e in T} == dict(expected)
+
+    path = str(tmpdir.join('e2es.npz'))
+    e2es.save(path)
+    loaded = Edge2Edges.load(path)
+    assert {e: set(loaded[e]) for e in T} == dict(expected)
+
+
+def test_build_edge2edges_csr_random():
+    g = random_signed_graph(p=0.2)
+    n = g.number_of_nodes()
+    T = set((i, j) for i in range(n) for j in range(i + 1, n)
+            if not g.has_edge(i, j))
+    expected = build_edge2edges(g, T)
+    for chunk_size in (3, 2**22):
+        e2es = build_edge2edges_csr(g2csr(g), T, chunk_size=chunk_size)
+        assert {e: set(e2es[e]) for e in T} == {e: expected[e] for e in T}
+
+
+def test_parallel_csr_kernels():
+    """sharded over processes, same outputs
+    """
+    g = random_signed_graph(p=0.2)
+    n = g.number_of_nodes()
+    C = np.random.RandomState(1).randint(0, 4, n)
+    T = [(i, j) for i in range(n) for j in range(i + 1, n)
+         if not g.has_edge(i, j)]
+    A = g2csr(g)
+
+    for actual, expected in zip(first_order_triangles_count_csr(A, C, T, n_jobs=2),
+                                first_order_triangles_count_csr(A, C, T)):
+        assert_allclose(actual, expected)
+
+    e2es = build_edge2edges_csr(A, T, n_jobs=2)
+    expected = build_edge2edges_csr(A, T)
+    assert_allclose(e2es.indptr, expected.indptr)
+    assert_allclose(e2es.indices, expected.indices)
+
+
+def test_changed_nodes():
+    C_old = np.array([0, 0, 1, 1, 2, 2])
+    # renumbered only
+    assert not changed_nodes(C_old, np.array([2, 2, 0, 0, 1, 1])).any()
+    # node 2 moved
+    assert changed_nodes(C_old, np.array([1, 1, 1, 0, 2, 2])).tolist() == \
+        [False, False, True, False, False, False]
+    # cluster split: one side keeps the cluster
+    assert changed_nodes(C_old, np.array([0, 0, 1, 3, 2, 2])).sum() == 1
+
+
+def test_triangle_count_cache():
+    g = random_signed_graph(p=0.2)
+    n = g.number_of_nodes()
+    rng = np.random.RandomState(1)
+    C = rng.randint(0, 4, n)
+    T = [(i, j) for i in range(n) for j in range(i + 1, n)
+         if not g.has_edge(i, j)]
+
+    cache = TriangleCountCache(T)
+    cache.update(g2csr(g), C)
+    cache.counts(T)
+    assert cache.n_recounted == len(T)
+
+    # add some target edges and move one node
+    for i, j in T[:3]:
+        g.add_edge(i, j, weight=1, sign=-1)
+    C = (C + 1) % 4
+    C[0] = (C[0] + 1) % 4
+    cache.update(g2csr(g), C)
+    actual = cache.counts(T)
+    assert len(T) < cache.n_recounted < 2 * len(T)
+
+    expected = first_order_triangles_count_csr(g2csr(g), C, T)
+    assert_allclose(actual[0], expected[0])
+    assert_allclose(actual[1], expected[1])